@@ -1,12 +1,94 @@
 import os
 import json
+import math
+import codecs
+import itertools
+import queue
+import base64
+import hashlib
+import gzip
+import collections
+import functools
+import atexit
 import sqlite3
+import threading
+import sys
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
+from urllib.parse import urlencode
 
-from flask import Flask, request, jsonify
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: every process runs retention
+    fcntl = None
+
+from flask import Flask, Response, g, has_request_context, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+try:
+    import orjson  # optional: `pip install orjson` for faster JSON
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # optional: `pip install brotli` adds Content-Encoding: br
+except ImportError:
+    brotli = None
+
+try:
+    import numpy as np  # optional: `pip install numpy` for the vectorized OHLC engine
+except ImportError:
+    np = None
+
+# ----------------------------
+# JSON
+# ----------------------------
+# orjson when installed, stdlib otherwise. Used for responses, request bodies,
+# the SSE stream and the JSON stored in events/deaths/heartbeat columns.
+def json_dumpb(obj, sort_keys: bool = False, default=None) -> bytes:
+    if orjson is not None:
+        try:
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+            if default is not None:
+                option |= orjson.OPT_PASSTHROUGH_DATETIME   # let Flask's default format dates
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass  # e.g. ints wider than 64 bits; the stdlib copes
+    return json.dumps(obj, separators=(",", ":"), sort_keys=sort_keys, default=default).encode()
+
+def json_dumps(obj, sort_keys: bool = False) -> str:
+    return json_dumpb(obj, sort_keys=sort_keys).decode()
+
+def json_loads(s):
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            pass  # NaN/Infinity from Python clients is only accepted by the stdlib
+    return json.loads(s)
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_dumpb(obj, sort_keys=self.sort_keys, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = json_dumpb(obj, sort_keys=self.sort_keys, default=self.default)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # ----------------------------
 # CORS
@@ -15,11 +97,13 @@ app = Flask(__name__)
 # If you want to tighten later, set:
 #   CORS_ORIGINS=https://your-vercel-domain.vercel.app
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*")
+# History pages carry their next-page cursor in these headers.
+CORS_EXPOSE_HEADERS = ["Link", "X-Next-Before-Id", "X-Next-After-Id"]
 if CORS_ORIGINS.strip() == "*":
-    CORS(app, resources={r"/*": {"origins": "*"}})
+    CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=CORS_EXPOSE_HEADERS)
 else:
     allowed = [o.strip() for o in CORS_ORIGINS.split(",") if o.strip()]
-    CORS(app, resources={r"/*": {"origins": allowed}})
+    CORS(app, resources={r"/*": {"origins": allowed}}, expose_headers=CORS_EXPOSE_HEADERS)
 
 # ----------------------------
 # Database config
@@ -34,17 +118,505 @@ def ensure_db_dir():
     if parent and not os.path.exists(parent):
         os.makedirs(parent, exist_ok=True)
 
+# ----------------------------
+# SQLite PRAGMA profile
+# ----------------------------
+# WAL lets the dashboard's readers run while the bot writes.
+# Override any entry with SQLITE_<NAME>, e.g. SQLITE_SYNCHRONOUS=FULL.
+PRAGMA_DEFAULTS = {
+    "journal_mode": "WAL",              # persistent, applied once in init_db()
+    "synchronous": "NORMAL",            # safe with WAL; FULL fsyncs every commit
+    "busy_timeout": "5000",             # ms to wait on a locked database
+    "cache_size": "-16000",             # negative = KiB (16 MB page cache)
+    "mmap_size": "134217728",           # 128 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "wal_autocheckpoint": "1000",       # pages
+}
+CONNECTION_PRAGMAS = ["busy_timeout", "synchronous", "cache_size", "mmap_size", "temp_store", "wal_autocheckpoint"]
+
+def _load_pragmas():
+    out = {}
+    for name, default in PRAGMA_DEFAULTS.items():
+        value = os.getenv(f"SQLITE_{name.upper()}", default).strip()
+        if not value.lstrip("-").isalnum():
+            raise ValueError(f"Invalid value for SQLITE_{name.upper()}: {value!r}")
+        out[name] = value
+    return out
+
+PRAGMAS = _load_pragmas()
+
+def _apply_connection_pragmas(conn):
+    for name in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name}={PRAGMAS[name]}")
+
+def effective_pragmas(conn) -> dict:
+    return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in PRAGMA_DEFAULTS}
+
+# ----------------------------
+# Slow-query log
+# ----------------------------
+# Pool connections use InstrumentedConnection when SLOW_QUERY_MS > 0. Every
+# statement is timed from execute() until its cursor is drained or dropped
+# (for a SELECT most of the scan happens while fetching), and statements
+# slower than the threshold land in a ring buffer with their parameters,
+# row count, calling helper and EXPLAIN QUERY PLAN. See /debug/slow-queries.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))          # 0 disables
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+SLOW_QUERIES = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+def _short_repr(v, limit: int = 200) -> str:
+    r = repr(v)
+    return r if len(r) <= limit else r[:limit] + "..."
+
+def _slow_query_caller() -> str:
+    # Innermost function in this module outside the instrumentation itself.
+    f = sys._getframe(2)
+    while f is not None:
+        code = f.f_code
+        if code.co_filename == __file__ and code.co_name not in _SLOW_QUERY_INTERNAL:
+            return code.co_name
+        f = f.f_back
+    return ""
+
+def _record_slow_query(conn, sql, params, seconds, rows, many=False):
+    plan = []
+    if not sql.lstrip()[:6].upper() in ("BEGIN", "COMMIT", "PRAGMA"):
+        try:
+            first = (params[0] if params else ()) if many else params
+            plan = [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, first)]
+        except (sqlite3.Error, TypeError, IndexError, KeyError):
+            pass
+    SLOW_QUERIES.append({
+        "time_utc": utc_now_iso(),
+        "ms": round(seconds * 1000, 3),
+        "caller": _slow_query_caller(),
+        "route": request.path if has_request_context() else "",
+        "sql": " ".join(sql.split()),
+        "params": _short_repr(params if not many else f"{len(params)} parameter sets"),
+        "rows": rows,
+        "plan": plan,
+    })
+    METRICS.inc("slow_queries_total")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None     # [sql, params, seconds so far, rows so far, many]
+
+    def _begin(self, sql, params, many):
+        self._finish()
+        return (sql, params, time.perf_counter(), many)
+
+    def execute(self, sql, params=()):
+        sql_, params_, t0, many = self._begin(sql, params, False)
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._pending = [sql_, params_, time.perf_counter() - t0, 0, many]
+
+    def executemany(self, sql, seq_of_params):
+        if not isinstance(seq_of_params, (list, tuple)):
+            seq_of_params = list(seq_of_params)
+        sql_, params_, t0, many = self._begin(sql, seq_of_params, True)
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._pending = [sql_, params_, time.perf_counter() - t0, 0, many]
+            self._finish()
+
+    def _fetched(self, t0, n, done):
+        p = self._pending
+        if p is not None:
+            p[2] += time.perf_counter() - t0
+            p[3] += n
+            if done:
+                self._finish()
+
+    def _finish(self):
+        p = self._pending
+        if p is None:
+            return
+        self._pending = None
+        sql, params, seconds, rows, many = p
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            if self.rowcount > 0:
+                rows = self.rowcount          # INSERT/UPDATE/DELETE
+            _record_slow_query(self.connection, sql, params, seconds, rows, many)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(t0, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(t0, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(t0, len(rows), True)
+        return rows
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(t0, 0, True)
+            raise
+        self._fetched(t0, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+_SLOW_QUERY_INTERNAL = {
+    "_slow_query_caller", "_record_slow_query", "_begin", "execute", "executemany",
+    "_fetched", "_finish", "fetchone", "fetchmany", "fetchall", "__next__", "close", "__del__",
+}
+
+# ----------------------------
+# Connection pool
+# ----------------------------
+# Connections are reused instead of being opened per helper call.
+# A thread keeps the connection it checked out for the whole `with get_conn()`
+# block: nested blocks share it and only the outermost one commits (or rolls
+# back on error). Idle connections go back to a bounded LIFO list.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))                    # max open connections per process
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))           # seconds to wait for a free connection
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))   # ping idle connections older than this
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = max(1, int(size))
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        # Also used after fork: connections must never cross process boundaries.
+        self._pid = os.getpid()
+        self._idle = []                      # [(conn, last_used_monotonic)]
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._local = threading.local()
+        self._closed = False
+        self._dir_ready = False
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "in_use": 0}
+
+    def _connect(self):
+        if not self._dir_ready:
+            ensure_db_dir()
+            self._dir_ready = True
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               factory=InstrumentedConnection if SLOW_QUERY_MS > 0 else sqlite3.Connection)
+        conn.row_factory = sqlite3.Row
+        _apply_connection_pragmas(conn)
+        self._count("created")
+        return conn
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _healthy(self, conn, idle_for: float) -> bool:
+        if idle_for < DB_POOL_CHECK_AFTER:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        self._count("discarded")
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def acquire(self):
+        self._check_fork()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise RuntimeError("database connection pool exhausted")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                    break
+                conn, last_used = item
+                if self._healthy(conn, time.monotonic() - last_used):
+                    self._count("reused")
+                    break
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        self._count("in_use")
+        return conn
+
+    def release(self, conn):
+        self._count("in_use", -1)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                closed = self._closed
+                if not closed:
+                    self._idle.append((conn, time.monotonic()))
+            if closed:
+                self._discard(conn)
+        except sqlite3.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        self._check_fork()
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.acquire()
+        local.conn = conn
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        finally:
+            local.conn = None
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections; ones still checked out are closed on release."""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _last_used in idle:
+            self._discard(conn)
+
+POOL = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+atexit.register(POOL.close)
+
 def get_conn():
-    ensure_db_dir()
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Usage: `with get_conn() as conn:` -- commits on success, rolls back on error."""
+    return POOL.connection()
+
+# ----------------------------
+# Metrics (Prometheus text format on /metrics)
+# ----------------------------
+# In-process counters and histograms; no client library or push gateway.
+# Each gunicorn worker keeps its own, and every sample carries a `pid`
+# label so scrapes from different workers don't overwrite each other.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help)
+        self._counters = {}    # (name, labels) -> value
+        self._hists = {}       # (name, labels) -> [bucket counts..., sum, count]
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, labels=()):
+        key = (name, tuple(labels))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += seconds
+            h[-1] += 1
+
+    def render(self, samples=()) -> str:
+        """samples: (name, type, labels, value) read by the caller at scrape time."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted((k, list(v)) for k, v in self._hists.items())
+        pid = (("pid", os.getpid()),)
+        out, seen = [], set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                help_text = self._meta.get(name, (kind, ""))[1]
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            out.append(f"{name}{_labels(pid + labels)} {value}")
+        for (name, labels), h in hists:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, h):
+                cumulative += n
+                out.append(f"{name}_bucket{_labels(pid + labels + (('le', bound),))} {cumulative}")
+            out.append(f"{name}_bucket{_labels(pid + labels + (('le', '+Inf'),))} {h[-1]}")
+            out.append(f"{name}_sum{_labels(pid + labels)} {h[-2]:.6f}")
+            out.append(f"{name}_count{_labels(pid + labels)} {h[-1]}")
+        for name, kind, labels, value in samples:
+            header(name, kind)
+            out.append(f"{name}{_labels(pid + tuple(labels))} {value}")
+        return "\n".join(out) + "\n"
+
+def _labels(pairs) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+METRICS = Metrics()
+METRICS.describe("http_requests_total", "counter", "HTTP requests by route, method and status.")
+METRICS.describe("http_request_duration_seconds", "histogram", "Time to produce the response (streams: until the first byte).")
+METRICS.describe("db_helper_duration_seconds", "histogram", "Wall time of DB helper calls, including waits for a pooled connection.")
+METRICS.describe("ingest_rows_total", "counter", "Rows written by ingest, per table.")
+METRICS.describe("cache_requests_total", "counter", "Snapshot cache lookups by cache and result.")
+METRICS.describe("compress_total", "counter", "Response bodies compressed, by encoding (cached bodies count once).")
+METRICS.describe("slow_queries_total", "counter", "Statements slower than SLOW_QUERY_MS.")
+METRICS.describe("db_file_bytes", "gauge", "Size of the SQLite database files.")
+METRICS.describe("db_pool_connections", "gauge", "Pooled SQLite connections by state.")
+METRICS.describe("stream_subscribers", "gauge", "Open /stream connections.")
+METRICS.describe("write_queue_depth", "gauge", "Ingest records waiting in the write-behind queue.")
+
+def timed(helper: str):
+    """Record each call of the decorated DB helper in db_helper_duration_seconds."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe("db_helper_duration_seconds", time.perf_counter() - t0, (("helper", helper),))
+        return inner
+    return wrap
+
+@app.before_request
+def _metrics_start():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _metrics_finish(resp):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        METRICS.inc("http_requests_total", (("route", route), ("method", request.method), ("status", resp.status_code)))
+        METRICS.observe("http_request_duration_seconds", time.perf_counter() - started,
+                        (("route", route), ("method", request.method)))
+    return resp
+
+# ----------------------------
+# Traffic recording
+# ----------------------------
+# RECORD_TRAFFIC=/path/traffic.jsonl appends one line per request:
+#   {"ts", "method", "path" (with query), "content_type", "headers", "body", "status", "ms"}
+# for bench/replay.py. "headers" keeps the RECORD_HEADERS the request sent:
+# they decide whether a poll is a 304 or a full (compressed) build. Each line is a single O_APPEND write, so gunicorn
+# workers can share the file. Bodies over RECORD_MAX_BODY bytes, and bodies
+# of endpoints that read request.stream themselves, are left out
+# ("body": null, "body_skipped": reason). /stream is not recorded.
+RECORD_TRAFFIC = os.getenv("RECORD_TRAFFIC", "").strip()
+RECORD_MAX_BODY = int(os.getenv("RECORD_MAX_BODY", str(64 * 1024)))
+RECORD_STREAMED_ENDPOINTS = {"ingest_batch"}
+RECORD_SKIP_PATHS = {"/stream"}
+RECORD_HEADERS = ("If-None-Match", "If-Modified-Since", "Accept-Encoding")
+
+class TrafficRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def write(self, entry: dict):
+        line = json_dumpb(entry) + b"\n"
+        with self._lock:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+
+RECORDER = TrafficRecorder(RECORD_TRAFFIC) if RECORD_TRAFFIC else None
+
+if RECORDER is not None:
+    @app.before_request
+    def _record_start():
+        if request.path in RECORD_SKIP_PATHS:
+            return
+        body, skipped = None, None
+        if request.endpoint in RECORD_STREAMED_ENDPOINTS:
+            skipped = "streamed"
+        elif (request.content_length or 0) > RECORD_MAX_BODY:
+            skipped = "too large"
+        elif request.content_length:
+            body = request.get_data(cache=True).decode("utf-8", "replace")
+        g.record = {"ts": round(time.time(), 6), "method": request.method, "path": request.full_path.rstrip("?"),
+                    "content_type": request.content_type or "",
+                    "headers": {h: request.headers[h] for h in RECORD_HEADERS if h in request.headers},
+                    "body": body}
+        if skipped:
+            g.record["body_skipped"] = skipped
+        g.record_started = time.perf_counter()
+
+    @app.after_request
+    def _record_finish(resp):
+        entry = g.pop("record", None)
+        if entry is not None:
+            entry["status"] = resp.status_code
+            entry["ms"] = round((time.perf_counter() - g.pop("record_started")) * 1000, 3)
+            try:
+                RECORDER.write(entry)
+            except OSError:
+                app.logger.exception("traffic recording failed")
+        return resp
 
 def _safe_json_loads(s):
     if not s:
         return None
     try:
-        return json.loads(s)
+        return json_loads(s)
     except Exception:
         return None
 
@@ -65,6 +637,43 @@ def _epoch_to_iso(epoch_s: int) -> str:
     except Exception:
         return utc_now_iso()
 
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1   # what SQLite can bind
+
+def _time_arg(name: str):
+    """Query arg as epoch seconds; accepts epoch seconds or ISO-8601. None if absent."""
+    v = request.args.get(name)
+    if v is None or v == "":
+        return None
+    try:
+        t = int(float(v))
+    except OverflowError:
+        raise ValueError(f"{name} must be epoch seconds or ISO-8601")
+    except ValueError:
+        pass
+    else:
+        if not INT64_MIN <= t <= INT64_MAX:
+            raise ValueError(f"{name} must be epoch seconds or ISO-8601")
+        return t
+    try:
+        dt = datetime.fromisoformat(v.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be epoch seconds or ISO-8601")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+def _parse_price(v):
+    """Returns (price, None) or (None, error) for one incoming tick value."""
+    if isinstance(v, bool) or not isinstance(v, (int, float, str)):
+        return None, "price must be a number"
+    try:
+        p = float(v)
+    except ValueError:
+        return None, "price must be a number"
+    if not math.isfinite(p) or p <= 0:
+        return None, "price must be a positive finite number"
+    return p, None
+
 def _safe_markets_list(m):
     """
     Accept markets in any of these shapes:
@@ -187,67 +796,305 @@ SCHEMA = [
     """
 ]
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
-    for stmt in SCHEMA:
-        cur.execute(stmt)
-
-    # Ensure control row exists (id=1)
-    cur.execute("SELECT id FROM control WHERE id=1")
-    if cur.fetchone() is None:
-        cur.execute(
-            "INSERT INTO control (id, state, pause_reason, pause_until_utc, cryo_reason, cryo_until_utc, updated_time_utc) "
-            "VALUES (1, 'ACTIVE', '', '', '', '', ?)",
-            (utc_now_iso(),)
+# ----------------------------
+# Candle rollups
+# ----------------------------
+# OHLC candles maintained at ingest time for the standard intervals, so
+# /ohlc reads finished candles instead of re-bucketing raw ticks.
+# Changing this tuple needs a migration that backfills the new interval.
+ROLLUP_INTERVALS = (60, 300, 900, 3600, 86400)   # 1m 5m 15m 1h 1d
+
+# first_epoch/last_epoch keep open/close right when ticks arrive out of order.
+CANDLE_UPSERT_CONFLICT = """
+    ON CONFLICT (market, interval_sec, bucket) DO UPDATE SET
+      o = CASE WHEN excluded.first_epoch < first_epoch THEN excluded.o ELSE o END,
+      c = CASE WHEN excluded.last_epoch >= last_epoch THEN excluded.c ELSE c END,
+      h = max(h, excluded.h),
+      l = min(l, excluded.l),
+      n = n + excluded.n,
+      first_epoch = min(first_epoch, excluded.first_epoch),
+      last_epoch = max(last_epoch, excluded.last_epoch)
+"""
+CANDLE_UPSERT = """
+    INSERT INTO candles (market, interval_sec, bucket, o, h, l, c, n, first_epoch, last_epoch)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+""" + CANDLE_UPSERT_CONFLICT
+
+def rollup_ticks(conn, rows):
+    """Fold price rows (dicts with market/time_epoch/price) into every rollup interval."""
+    params = []
+    for r in rows:
+        t, p = int(r["time_epoch"]), float(r["price"])
+        for iv in ROLLUP_INTERVALS:
+            params.append((r["market"], iv, (t // iv) * iv, p, p, p, p, t, t))
+    conn.executemany(CANDLE_UPSERT, params)
+
+# ----------------------------
+# Migrations
+# ----------------------------
+# Run in order by init_db(); PRAGMA user_version records the last one applied.
+# Never edit a released migration -- append a new one.
+def _migration_1_time_series_indexes(conn):
+    for stmt in [
+        "CREATE INDEX IF NOT EXISTS idx_prices_market_time ON prices(market, time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_prices_time ON prices(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_market_time ON trades(market, time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_trades_time ON trades(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_equity_time ON equity(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_events_type_time ON events(type, time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_events_time ON events(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_deaths_time ON deaths(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_heartbeat_time ON heartbeat(time_epoch)",
+        "CREATE INDEX IF NOT EXISTS idx_pet_time ON pet(time_epoch)",
+    ]:
+        conn.execute(stmt)
+
+def _migration_2_candles(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS candles (
+          market TEXT NOT NULL,
+          interval_sec INTEGER NOT NULL,
+          bucket INTEGER NOT NULL,            -- bucket start epoch
+          o REAL NOT NULL,
+          h REAL NOT NULL,
+          l REAL NOT NULL,
+          c REAL NOT NULL,
+          n INTEGER NOT NULL DEFAULT 1,       -- ticks in bucket
+          first_epoch INTEGER NOT NULL,
+          last_epoch INTEGER NOT NULL,
+          PRIMARY KEY (market, interval_sec, bucket)
+        ) WITHOUT ROWID
+        """
+    )
+    # Backfill from existing ticks ("WHERE true" keeps ON CONFLICT unambiguous).
+    for iv in ROLLUP_INTERVALS:
+        conn.execute(
+            """
+            INSERT INTO candles (market, interval_sec, bucket, o, h, l, c, n, first_epoch, last_epoch)
+            SELECT market, ?, (time_epoch / ?) * ?, price, price, price, price, 1, time_epoch, time_epoch
+            FROM prices WHERE true
+            ORDER BY time_epoch, id
+            """ + CANDLE_UPSERT_CONFLICT,
+            (iv, iv, iv)
         )
 
-    conn.commit()
-    conn.close()
+def _migration_3_table_versions(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+          name TEXT PRIMARY KEY,
+          version INTEGER NOT NULL DEFAULT 0,       -- bumped by every write
+          generation INTEGER NOT NULL DEFAULT 0,    -- bumped when the table is wiped
+          updated_epoch INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """
+    )
+
+def _migration_4_market_stats(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_stats (
+          market TEXT PRIMARY KEY,
+          trades INTEGER NOT NULL DEFAULT 0,
+          wins INTEGER NOT NULL DEFAULT 0,          -- pnl_usd > 0
+          losses INTEGER NOT NULL DEFAULT 0,        -- pnl_usd < 0
+          total_pnl_usd REAL NOT NULL DEFAULT 0,
+          last_time_epoch INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO market_stats (market, trades, wins, losses, total_pnl_usd, last_time_epoch)
+        SELECT market, COUNT(*), SUM(pnl_usd > 0), SUM(pnl_usd < 0), COALESCE(SUM(pnl_usd), 0), MAX(time_epoch)
+        FROM trades GROUP BY market
+        """
+    )
+
+MIGRATIONS = [
+    (1, _migration_1_time_series_indexes),
+    (2, _migration_2_candles),
+    (3, _migration_3_table_versions),
+    (4, _migration_4_market_stats),
+]
+
+def run_migrations(conn):
+    for version, migrate in MIGRATIONS:
+        # BEGIN IMMEDIATE serializes gunicorn workers booting at the same time.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version={int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def init_db():
+    with get_conn() as conn:
+        # journal_mode can't change inside a transaction; it sticks to the file.
+        conn.execute(f"PRAGMA journal_mode={PRAGMAS['journal_mode']}")
+
+        cur = conn.cursor()
+        for stmt in SCHEMA:
+            cur.execute(stmt)
+
+        # Ensure control row exists (id=1)
+        cur.execute("SELECT id FROM control WHERE id=1")
+        if cur.fetchone() is None:
+            cur.execute(
+                "INSERT INTO control (id, state, pause_reason, pause_until_utc, cryo_reason, cryo_until_utc, updated_time_utc) "
+                "VALUES (1, 'ACTIVE', '', '', '', '', ?)",
+                (utc_now_iso(),)
+            )
+        conn.commit()
+
+        run_migrations(conn)
 
 init_db()
 
+# ----------------------------
+# Change tracking
+# ----------------------------
+# Every write bumps its table's row in `table_versions` inside the same
+# transaction, so any gunicorn worker can tell whether cached output is stale.
+def touch_tables(conn, tables, wiped: bool = False):
+    now = int(time.time())
+    conn.executemany(
+        "INSERT INTO table_versions (name, version, generation, updated_epoch) VALUES (?, 1, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET version = version + 1, "
+        "generation = generation + excluded.generation, updated_epoch = excluded.updated_epoch",
+        [(t, int(wiped), now) for t in tables]
+    )
+
+def table_versions(conn) -> dict:
+    """{table: (version, generation, updated_epoch)}; tables never written are absent."""
+    rows = conn.execute("SELECT name, version, generation, updated_epoch FROM table_versions").fetchall()
+    return {r["name"]: (r["version"], r["generation"], r["updated_epoch"]) for r in rows}
+
 # ----------------------------
 # Helpers: fetch
 # ----------------------------
-ALLOWED_TABLES = {"control","heartbeat","pet","prices","equity","trades","events","deaths"}
+ALLOWED_TABLES = {"control","heartbeat","pet","prices","equity","trades","events","deaths","candles","market_stats"}
 
+@timed("fetch_one")
 def fetch_one(table: str, order_by="id DESC"):
     if table not in ALLOWED_TABLES:
         raise ValueError("Invalid table")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM {table} ORDER BY {order_by} LIMIT 1")
-    row = cur.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        row = conn.execute(f"SELECT * FROM {table} ORDER BY {order_by} LIMIT 1").fetchone()
     return dict(row) if row else None
 
+FETCH_MANY_SQL = "SELECT * FROM {table} ORDER BY {order_by} LIMIT ?"
+FETCH_SINCE_SQL = "SELECT * FROM {table} WHERE id > ? ORDER BY id DESC LIMIT ?"
+
+@timed("fetch_many")
 def fetch_many(table: str, limit=50, order_by="id DESC"):
     if table not in ALLOWED_TABLES:
         raise ValueError("Invalid table")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM {table} ORDER BY {order_by} LIMIT ?", (int(limit),))
-    rows = cur.fetchall()
-    conn.close()
+    with get_conn() as conn:
+        rows = conn.execute(FETCH_MANY_SQL.format(table=table, order_by=order_by), (int(limit),)).fetchall()
     return [dict(r) for r in rows]
 
+@timed("fetch_since")
+def fetch_since(table: str, after_id: int, limit=50):
+    """Rows with id > after_id, newest first (same order as fetch_many's default)."""
+    if table not in ALLOWED_TABLES:
+        raise ValueError("Invalid table")
+    with get_conn() as conn:
+        rows = conn.execute(FETCH_SINCE_SQL.format(table=table), (int(after_id), int(limit))).fetchall()
+    return [dict(r) for r in rows]
+
+@timed("fetch_page")
+def fetch_page(table: str, limit=50, before_id=None, after_id=None, from_epoch=None, to_epoch=None):
+    """
+    Keyset page of `table`, newest first. before_id walks back from a page's
+    oldest id, after_id forward from a page's newest id; either way each page
+    is one index seek, however deep into history it is.
+    from_epoch/to_epoch bound time_epoch (inclusive/exclusive). With a time
+    bound, pages follow the time index, ordered by (time_epoch, id), and the
+    cursor row's time_epoch is looked up to continue from it.
+    """
+    if table not in ALLOWED_TABLES:
+        raise ValueError("Invalid table")
+    forward = after_id is not None
+    anchor = after_id if forward else before_id
+    by_time = from_epoch is not None or to_epoch is not None
+    with get_conn() as conn:
+        anchor_time = None
+        if anchor is not None and by_time:
+            row = conn.execute(f"SELECT time_epoch FROM {table} WHERE id = ?", (int(anchor),)).fetchone()
+            anchor_time = row[0] if row is not None else None
+        sql, params = _page_sql(table, limit, forward, by_time, anchor, anchor_time, from_epoch, to_epoch)
+        rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    # Walking forward takes the oldest rows past after_id; flip them back to newest first.
+    if forward:
+        rows.reverse()
+    return rows
+
+def _page_sql(table, limit, forward, by_time, anchor, anchor_time, from_epoch, to_epoch):
+    """fetch_page's query: (sql, params). anchor_time is the cursor row's time_epoch, if it was looked up."""
+    lo = None if from_epoch is None else int(from_epoch)          # time_epoch >= lo
+    hi = None if to_epoch is None else int(to_epoch) - 1          # time_epoch <= hi
+    where, params = [], []
+    if anchor_time is not None:
+        # Fold the cursor into the time range so the index seek starts
+        # at the cursor, not at the edge of from/to.
+        if forward:
+            lo = anchor_time if lo is None else max(lo, anchor_time)
+        else:
+            hi = anchor_time if hi is None else min(hi, anchor_time)
+        where.append("(time_epoch > ? OR id > ?)" if forward else "(time_epoch < ? OR id < ?)")
+        params += [anchor_time, int(anchor)]
+    elif anchor is not None:
+        where.append(f"id {'>' if forward else '<'} ?")
+        params.append(int(anchor))
+    if lo is not None:
+        where.append("time_epoch >= ?")
+        params.append(lo)
+    if hi is not None:
+        where.append("time_epoch <= ?")
+        params.append(hi)
+    order = "ASC" if forward else "DESC"
+    sql = f"SELECT * FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY time_epoch {order}, id {order}" if by_time else f" ORDER BY id {order}"
+    return sql + " LIMIT ?", params + [int(limit)]
+
+@timed("insert_row")
 def insert_row(table: str, data: dict):
     if table not in ALLOWED_TABLES:
         raise ValueError("Invalid table")
-    conn = get_conn()
-    cur = conn.cursor()
     cols = list(data.keys())
     vals = [data[c] for c in cols]
     placeholders = ",".join(["?"] * len(cols))
-    cur.execute(
-        f"INSERT INTO {table} ({','.join(cols)}) VALUES ({placeholders})",
-        vals
-    )
-    conn.commit()
-    new_id = cur.lastrowid
-    conn.close()
-    return new_id
+    with get_conn() as conn:
+        cur = conn.execute(
+            f"INSERT INTO {table} ({','.join(cols)}) VALUES ({placeholders})",
+            vals
+        )
+        touch_tables(conn, [table])
+        return cur.lastrowid
+
+@timed("insert_many")
+def insert_many(table: str, rows: list):
+    """Insert rows (dicts sharing the same keys) with one executemany in one transaction."""
+    if table not in ALLOWED_TABLES:
+        raise ValueError("Invalid table")
+    if not rows:
+        return 0
+    cols = list(rows[0].keys())
+    placeholders = ",".join(["?"] * len(cols))
+    with get_conn() as conn:
+        conn.executemany(
+            f"INSERT INTO {table} ({','.join(cols)}) VALUES ({placeholders})",
+            [[r[c] for c in cols] for r in rows]
+        )
+        touch_tables(conn, [table])
+    return len(rows)
 
 def add_event(ev_type: str, message: str, details=None):
     details = details or {}
@@ -257,7 +1104,7 @@ def add_event(ev_type: str, message: str, details=None):
         "time_epoch": _to_epoch(t),
         "type": ev_type,
         "message": message,
-        "details": json.dumps(details)
+        "details": json_dumps(details)
     })
 
 def get_control():
@@ -266,113 +1113,697 @@ def get_control():
         return {"id": 1, "state": "ACTIVE", "pause_reason":"", "pause_until_utc":"", "cryo_reason":"", "cryo_until_utc":"", "updated_time_utc": utc_now_iso()}
     return c
 
-def is_paused_or_cryo():
-    c = get_control()
-    now = datetime.now(timezone.utc)
-    state = (c.get("state") or "ACTIVE").upper()
-
-    pause_until = (c.get("pause_until_utc") or "").replace("Z", "+00:00")
-    cryo_until = (c.get("cryo_until_utc") or "").replace("Z", "+00:00")
-
-    paused = False
-    cryo = False
+def _until_epoch(iso_utc: str):
+    """Deadline of a PAUSED/CRYO timer; None = no timer. Unparseable counts as not elapsed."""
+    s = (iso_utc or "").replace("Z", "+00:00")
+    if not s:
+        return None
+    try:
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except Exception:
+        return math.inf
 
-    if state == "PAUSED" and pause_until:
+class ControlState:
+    """
+    The control row, parsed once per change instead of on every /data poll.
+    Keyed on the control table's version, so /control/* writes from any
+    worker invalidate it. Reads never write: an elapsed PAUSED/CRYO timer
+    reads as ACTIVE straight away, and a timer armed for the deadline
+    persists the thaw with a compare-and-set, so only one worker logs it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._key = None
+        self._row = None
+        self._until = None
+        self._timer = None
+        self._timer_at = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            self._reset()
+        with get_conn() as conn:
+            v = conn.execute("SELECT version, generation FROM table_versions WHERE name = 'control'").fetchone()
+            key = tuple(v) if v else None
+            if key != self._key or self._row is None:
+                row = get_control()
+                with self._lock:
+                    self._key, self._row = key, row
+                    state = (row.get("state") or "ACTIVE").upper()
+                    until = None
+                    if state in ("PAUSED", "CRYO"):
+                        # No timer set: thaws right away, as before.
+                        until = _until_epoch(row.get("pause_until_utc" if state == "PAUSED" else "cryo_until_utc")) or 0.0
+                    self._until = until
+                    self._arm()
+            return self._row, self._until
+
+    def _arm(self):
+        until = self._until
+        if until == self._timer_at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._timer_at = until
+        if until is not None and until != math.inf:
+            row = self._row
+            self._timer = threading.Timer(max(0.0, until - time.time()), self._thaw, args=(row,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _thaw(self, row):
         try:
-            dt = datetime.fromisoformat(pause_until)
-            paused = dt > now
+            if _set_control_state("ACTIVE", reason="timer complete", expect=row):
+                BROKER.publish("control", {"state": "ACTIVE", "reason": "timer complete"})
         except Exception:
-            paused = True
+            app.logger.exception("control auto-thaw failed")
 
-    if state == "CRYO" and cryo_until:
-        try:
-            dt = datetime.fromisoformat(cryo_until)
-            cryo = dt > now
-        except Exception:
-            cryo = True
+CONTROL = ControlState()
 
-    # Auto-thaw: if timers elapsed, return ACTIVE
-    if state in ("PAUSED","CRYO") and not paused and not cryo:
-        _set_control_state("ACTIVE", reason="timer complete")
-        c = get_control()
+def is_paused_or_cryo():
+    c, until = CONTROL.get()
+    state = (c.get("state") or "ACTIVE").upper()
+    # Auto-thaw: if timers elapsed, report ACTIVE (the timer persists it)
+    if state in ("PAUSED", "CRYO") and until <= time.time():
         state = "ACTIVE"
-
     return state, c
 
-def _set_control_state(state: str, reason: str = ""):
+def _set_control_state(state: str, reason: str = "", expect=None) -> bool:
+    """
+    expect: a control row as read earlier; the update only applies if the row
+    is unchanged since (compare-and-set). Returns whether it applied.
+    """
     state = (state or "ACTIVE").upper()
 
-    conn = get_conn()
-    cur = conn.cursor()
-
     if state == "ACTIVE":
-        cur.execute(
-            "UPDATE control SET state='ACTIVE', pause_reason='', pause_until_utc='', cryo_reason='', cryo_until_utc='', updated_time_utc=? WHERE id=1",
-            (utc_now_iso(),)
-        )
-        conn.commit()
-        conn.close()
-        add_event("info", "State -> ACTIVE", {"reason": reason})
-        return
+        sql = "UPDATE control SET state='ACTIVE', pause_reason='', pause_until_utc='', cryo_reason='', cryo_until_utc='', updated_time_utc=? WHERE id=1"
+        params = [utc_now_iso()]
+        if expect is not None:
+            sql += " AND state=? AND pause_until_utc=? AND cryo_until_utc=? AND updated_time_utc=?"
+            params += [expect.get(k) for k in ("state", "pause_until_utc", "cryo_until_utc", "updated_time_utc")]
+        with get_conn() as conn:
+            if not conn.execute(sql, params).rowcount:
+                return False
+            touch_tables(conn, ["control"])
+            add_event("info", "State -> ACTIVE", {"reason": reason})
+        return True
 
     # PAUSED/CRYO are handled by their endpoints which set until/reason fields
-    conn.close()
+    return False
+
+# ----------------------------
+# Per-market trade statistics
+# ----------------------------
+# Maintained by ingest_trade() so the dashboard aggregates cost O(markets),
+# not O(trade history). A trade with pnl_usd == 0 counts as a trade only.
+def add_market_stats(conn, trades):
+    conn.executemany(
+        """
+        INSERT INTO market_stats (market, trades, wins, losses, total_pnl_usd, last_time_epoch)
+        VALUES (?, 1, ?, ?, ?, ?)
+        ON CONFLICT (market) DO UPDATE SET
+          trades = trades + 1,
+          wins = wins + excluded.wins,
+          losses = losses + excluded.losses,
+          total_pnl_usd = total_pnl_usd + excluded.total_pnl_usd,
+          last_time_epoch = max(last_time_epoch, excluded.last_time_epoch)
+        """,
+        [(t["market"], int(t["pnl_usd"] > 0), int(t["pnl_usd"] < 0), t["pnl_usd"], t["time_epoch"]) for t in trades]
+    )
+    touch_tables(conn, ["market_stats"])
+
+def _win_rate(wins, losses) -> float:
+    decided = wins + losses
+    return round(100.0 * wins / decided, 2) if decided else 0.0
+
+@timed("market_stats")
+def market_stats():
+    """(per_market, totals) with win_rate in percent and avg_pnl per trade."""
+    with get_conn() as conn:
+        rows = conn.execute("SELECT * FROM market_stats ORDER BY trades DESC, market").fetchall()
+    per_market = []
+    totals = {"trades": 0, "wins": 0, "losses": 0, "total_pnl_usd": 0.0}
+    for r in rows:
+        per_market.append({
+            "market": r["market"],
+            "trades": r["trades"],
+            "wins": r["wins"],
+            "losses": r["losses"],
+            "win_rate": _win_rate(r["wins"], r["losses"]),
+            "total_pnl": round(r["total_pnl_usd"], 8),
+            "avg_pnl": round(r["total_pnl_usd"] / r["trades"], 8) if r["trades"] else 0.0,
+        })
+        totals["trades"] += r["trades"]
+        totals["wins"] += r["wins"]
+        totals["losses"] += r["losses"]
+        totals["total_pnl_usd"] += r["total_pnl_usd"]
+    totals["total_pnl_usd"] = round(totals["total_pnl_usd"], 8)
+    totals["win_rate"] = _win_rate(totals["wins"], totals["losses"])
+    return per_market, totals
 
 # ----------------------------
 # OHLC aggregation (candles from tick prices)
 # ----------------------------
-def compute_ohlc(market: str, interval_sec: int = 60, limit: int = 200):
+OHLC_MAX_MARKETS = int(os.getenv("OHLC_MAX_MARKETS", "50"))
+# Raw-tick candles: "sql" (aggregated inside SQLite), "numpy" (vectorized,
+# needs numpy), "python", or "auto" (= sql). Below OHLC_NUMPY_MIN_TICKS the
+# numpy array setup costs more than it saves, so short ranges take the loop.
+OHLC_ENGINE = os.getenv("OHLC_ENGINE", "auto").strip().lower()
+if OHLC_ENGINE not in ("sql", "numpy", "python") or (OHLC_ENGINE == "numpy" and np is None):
+    OHLC_ENGINE = "sql"
+OHLC_NUMPY_MIN_TICKS = int(os.getenv("OHLC_NUMPY_MIN_TICKS", "500"))
+
+@timed("compute_ohlc")
+def compute_ohlc(market: str, interval_sec: int = 60, limit: int = 200, from_epoch=None, to_epoch=None, fill=False):
     """
     Builds OHLC from tick stream stored in `prices`.
     interval_sec: candle size in seconds (e.g. 60, 300, 900)
+    Intervals in ROLLUP_INTERVALS are read from the `candles` rollup table;
+    anything else is bucketed from raw ticks.
     Returns candles with:
       t = bucket start epoch seconds
       time_utc = bucket start ISO string (NEW + helpful for UI)
       o/h/l/c = floats
+      n = ticks in the bucket
     """
     market = (market or "").strip()
+    return compute_ohlc_many([market], interval_sec, limit, from_epoch, to_epoch, fill).get(market, [])
+
+@timed("compute_ohlc_many")
+def compute_ohlc_many(markets, interval_sec: int = 60, limit: int = 200, from_epoch=None, to_epoch=None, fill=False):
+    """
+    Candles for several markets at once: {market: [candle, ...]}.
+    from_epoch/to_epoch bound the bucket start (inclusive/exclusive); a
+    bucket in range is returned whole, ticks past to_epoch included. With
+    from_epoch the first `limit` non-empty candles from there are returned,
+    otherwise the last `limit` before to_epoch (or now).
+    fill: add flat candles (o=h=l=c=previous close, "filled": true) for empty
+    buckets between the first and last candle.
+    """
+    markets = list(dict.fromkeys(m.strip() for m in markets if m and m.strip()))
     interval_sec = max(10, int(interval_sec))
     limit = max(10, min(1000, int(limit)))
-
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT time_epoch, price
-        FROM prices
-        WHERE market = ?
-        ORDER BY time_epoch DESC
+    if from_epoch is not None:
+        from_epoch = (int(from_epoch) // interval_sec) * interval_sec
+    from_start = from_epoch is not None
+
+    if interval_sec in ROLLUP_INTERVALS:
+        out = _rollup_candles(markets, interval_sec, limit, from_epoch, to_epoch)
+    else:
+        out = _raw_candles(markets, interval_sec, limit, from_epoch, to_epoch)
+
+    for m, candles in out.items():
+        if fill and candles:
+            candles = _fill_gaps(candles, interval_sec, limit, from_start)
+        out[m] = candles[:limit] if from_start else candles[-limit:]
+    return out
+
+def _candle(bucket, o, h, l, c, n):
+    return {"t": bucket, "time_utc": _epoch_to_iso(bucket), "o": o, "h": h, "l": l, "c": c, "n": n}
+
+def _rollup_sql(from_epoch, to_epoch):
+    """_rollup_candles' query and its bound params, which follow (market, interval_sec) and precede the limit."""
+    where, params = "", []
+    if from_epoch is not None:
+        where += " AND bucket >= ?"
+        params.append(from_epoch)
+    if to_epoch is not None:
+        where += " AND bucket < ?"
+        params.append(int(to_epoch))
+    order = "ASC" if from_epoch is not None else "DESC"
+    sql = f"""
+        SELECT bucket, o, h, l, c, n
+        FROM candles
+        WHERE market = ? AND interval_sec = ?{where}
+        ORDER BY bucket {order}
         LIMIT ?
-        """,
-        (market, 5000)
-    ).fetchall()
-    conn.close()
+    """
+    return sql, params
+
+def _rollup_candles(markets, interval_sec, limit, from_epoch, to_epoch):
+    # One primary-key range seek per market, all in one read snapshot.
+    sql, params = _rollup_sql(from_epoch, to_epoch)
+    out = {}
+    with get_conn() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        for m in markets:
+            rows = conn.execute(sql, [m, interval_sec] + params + [limit]).fetchall()
+            if from_epoch is None:
+                rows = rows[::-1]
+            out[m] = [_candle(*r) for r in rows]
+    return out
+
+def _raw_candles(markets, interval_sec, limit, from_epoch, to_epoch):
+    # Same rule as the rollup path: a bucket is in range when its start is,
+    # and is returned whole.
+    hi = OHLC_NO_END if to_epoch is None else min(OHLC_NO_END, -(-int(to_epoch) // interval_sec) * interval_sec)
+    out = {}
+    with get_conn() as conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        for m in markets:
+            # The first `limit` non-empty buckets from `from`, else the last `limit` before `to`.
+            sql = OHLC_LAST_BUCKETS_SQL if from_epoch is None else OHLC_FIRST_BUCKETS_SQL
+            first, last = conn.execute(sql, {
+                "m": m, "lo": from_epoch, "hi": hi, "iv": interval_sec, "limit": limit
+            }).fetchone()
+            if last is None:
+                out[m] = []
+                continue
+            lo, m_hi = first, last + interval_sec
+
+            cur = conn.cursor()
+            cur.row_factory = None      # plain tuples: cheaper, and what numpy's fromiter takes
+            if OHLC_ENGINE == "sql":
+                rows = cur.execute(OHLC_SQL, {"m": m, "lo": lo, "hi": m_hi, "iv": interval_sec}).fetchall()
+            else:
+                ticks = cur.execute(OHLC_TICKS_SQL, (m, lo, m_hi)).fetchall()
+                rows = bucket_ticks(ticks, interval_sec)
+            out[m] = [_candle(*r) for r in rows]
+    return out
+
+# Candles computed inside SQLite; only the finished candles cross into Python.
+# Walks the non-empty bucket starts in [lo, hi), each found with one MIN seek
+# past the previous bucket, and answers each candle with index range seeks on
+# idx_prices_market_time: open/close are the first/last tick by
+# (time_epoch, id). A GROUP BY over time_epoch / interval, or window functions
+# partitioned by it, would sort every tick in the range in a temp b-tree first.
+OHLC_SQL = """
+WITH RECURSIVE b(t) AS (
+    SELECT (SELECT MIN(time_epoch) FROM prices WHERE market = :m AND time_epoch >= :lo AND time_epoch < :hi) / :iv * :iv
+    UNION ALL
+    SELECT (SELECT MIN(time_epoch) FROM prices WHERE market = :m AND time_epoch >= b.t + :iv AND time_epoch < :hi) / :iv * :iv
+    FROM b WHERE b.t IS NOT NULL
+)
+SELECT t, o, h, l, c, n FROM (
+    SELECT t,
+        (SELECT price FROM prices WHERE market = :m AND time_epoch >= t AND time_epoch < t + :iv
+         ORDER BY time_epoch, id LIMIT 1) AS o,
+        (SELECT MAX(price) FROM prices WHERE market = :m AND time_epoch >= t AND time_epoch < t + :iv) AS h,
+        (SELECT MIN(price) FROM prices WHERE market = :m AND time_epoch >= t AND time_epoch < t + :iv) AS l,
+        (SELECT price FROM prices WHERE market = :m AND time_epoch >= t AND time_epoch < t + :iv
+         ORDER BY time_epoch DESC, id DESC LIMIT 1) AS c,
+        (SELECT COUNT(*) FROM prices WHERE market = :m AND time_epoch >= t AND time_epoch < t + :iv) AS n
+    FROM b WHERE t IS NOT NULL
+)
+"""
+
+# First and last bucket start of the last `limit` non-empty buckets before
+# :hi (or the first `limit` from :lo), one MAX (MIN) seek per bucket, so
+# that sparse markets get `limit` candles too.
+OHLC_LAST_BUCKETS_SQL = """
+WITH RECURSIVE b(t, k) AS (
+    SELECT (SELECT MAX(time_epoch) FROM prices WHERE market = :m AND time_epoch < :hi) / :iv * :iv, 1
+    UNION ALL
+    SELECT (SELECT MAX(time_epoch) FROM prices WHERE market = :m AND time_epoch < b.t) / :iv * :iv, k + 1
+    FROM b WHERE b.t IS NOT NULL AND k < :limit
+)
+SELECT MIN(t), MAX(t) FROM b
+"""
+OHLC_FIRST_BUCKETS_SQL = """
+WITH RECURSIVE b(t, k) AS (
+    SELECT (SELECT MIN(time_epoch) FROM prices WHERE market = :m AND time_epoch >= :lo AND time_epoch < :hi) / :iv * :iv, 1
+    UNION ALL
+    SELECT (SELECT MIN(time_epoch) FROM prices WHERE market = :m AND time_epoch >= b.t + :iv AND time_epoch < :hi) / :iv * :iv, k + 1
+    FROM b WHERE b.t IS NOT NULL AND k < :limit
+)
+SELECT MIN(t), MAX(t) FROM b
+"""
+OHLC_NO_END = 1 << 62
+OHLC_TICKS_SQL = "SELECT time_epoch, price FROM prices WHERE market = ? AND time_epoch >= ? AND time_epoch < ? ORDER BY time_epoch"
+
+def bucket_ticks(ticks, interval_sec: int, engine: str = None):
+    """
+    (time_epoch, price) rows in time order -> [(bucket, o, h, l, c, n), ...].
+    engine: "numpy" or "python"; defaults to OHLC_ENGINE.
+    """
+    engine = engine or OHLC_ENGINE
+    if engine == "numpy" and len(ticks) >= OHLC_NUMPY_MIN_TICKS:
+        return _bucket_ticks_numpy(ticks, interval_sec)
+    return _bucket_ticks_python(ticks, interval_sec)
 
-    if not rows:
+def _bucket_ticks_python(ticks, interval_sec):
+    buckets = {}
+    for t, p in ticks:
+        p = float(p)
+        b = (t // interval_sec) * interval_sec
+        d = buckets.get(b)
+        if d is None:
+            buckets[b] = [b, p, p, p, p, 1]
+        else:
+            if p > d[2]:
+                d[2] = p
+            if p < d[3]:
+                d[3] = p
+            d[4] = p
+            d[5] += 1
+    return [tuple(d) for d in buckets.values()]
+
+def _bucket_ticks_numpy(ticks, interval_sec):
+    if not ticks:
         return []
+    arr = np.fromiter(ticks, dtype=[("t", np.int64), ("p", np.float64)], count=len(ticks))
+    p = arr["p"]
+    b = (arr["t"] // interval_sec) * interval_sec
+    # Ticks are time ordered, so each bucket is one contiguous run.
+    starts = np.flatnonzero(np.diff(b)) + 1
+    starts = np.concatenate(([0], starts))
+    ends = np.concatenate((starts[1:], [len(p)]))
+    return list(zip(
+        b[starts].tolist(),
+        p[starts].tolist(),
+        np.maximum.reduceat(p, starts).tolist(),
+        np.minimum.reduceat(p, starts).tolist(),
+        p[ends - 1].tolist(),
+        (ends - starts).tolist(),
+    ))
+
+def _fill_gaps(candles, interval_sec, limit, from_start):
+    # Fill only the stretch that can survive the final `limit` slice.
+    if from_start:
+        first = candles[0]["t"]
+        last = min(candles[-1]["t"], first + interval_sec * (limit - 1))
+    else:
+        last = candles[-1]["t"]
+        first = max(candles[0]["t"], last - interval_sec * (limit - 1))
+    by_t = {c["t"]: c for c in candles}
+    prev = None
+    for c in candles:
+        if c["t"] > first:
+            break
+        prev = c
+    out = []
+    for b in range(first, last + 1, interval_sec):
+        c = by_t.get(b)
+        if c is None:
+            if prev is None:
+                continue
+            c = _candle(b, prev["c"], prev["c"], prev["c"], prev["c"], 0)
+            c["filled"] = True
+        out.append(c)
+        prev = c
+    return out
 
-    # We pulled DESC; process ASC
-    ticks = [{"t": int(r["time_epoch"]), "p": float(r["price"])} for r in rows][::-1]
+# ----------------------------
+# Query plan checks
+# ----------------------------
+# The SQL the read path runs on every dashboard poll, candle and history
+# request, built by the same helpers and constants that run it, with the
+# index each one is expected to use (None = primary key order is enough).
+PAGED_TABLES = ("equity", "trades", "prices", "events", "deaths")
+
+def _hot_queries():
+    m, iv, lo, hi = "BTCUSDT", 45, 0, 2**40
+    ohlc = {"m": m, "lo": lo, "hi": hi, "iv": iv, "limit": 200}
+    out = [
+        ("compute_ohlc(sql)", OHLC_SQL, ohlc, "idx_prices_market_time"),
+        ("compute_ohlc(last buckets)", OHLC_LAST_BUCKETS_SQL, ohlc, "idx_prices_market_time"),
+        ("compute_ohlc(first buckets)", OHLC_FIRST_BUCKETS_SQL, ohlc, "idx_prices_market_time"),
+        ("compute_ohlc(ticks)", OHLC_TICKS_SQL, (m, lo, hi), "idx_prices_market_time"),
+    ]
+    for name, bounds in (("latest", (None, None)), ("from", (lo, None)), ("to", (None, hi)), ("from/to", (lo, hi))):
+        sql, params = _rollup_sql(*bounds)
+        out.append((f"compute_ohlc(rollup, {name})", sql, [m, 60] + params + [200], "PRIMARY KEY"))
+    for table in ("heartbeat", "pet"):
+        out.append((f"fetch_one({table})", f"SELECT * FROM {table} ORDER BY id DESC LIMIT 1", (), None))
+    for table in PAGED_TABLES:
+        out.append((f"fetch_many({table})", FETCH_MANY_SQL.format(table=table, order_by="id DESC"), (100,), None))
+        out.append((f"fetch_since({table})", FETCH_SINCE_SQL.format(table=table), (0, 100), None))
+        for name, forward, by_time, anchor, anchor_time in (
+            ("", False, False, None, None),
+            (", before_id", False, False, 100, None),
+            (", to", False, True, None, None),
+            (", to, before_id", False, True, 100, 1000),
+            (", from, after_id", True, True, 100, 1000),
+        ):
+            sql, params = _page_sql(table, 100, forward, by_time, anchor, anchor_time,
+                                    lo if forward else None, hi if by_time else None)
+            out.append((f"fetch_page({table}{name})", sql, params, f"idx_{table}_time" if by_time else None))
+    return out
+
+HOT_QUERIES = _hot_queries()
+
+def check_query_plans(conn) -> list:
+    """EXPLAIN QUERY PLAN each hot query; ok=False means a temp sort or the wrong index."""
+    out = []
+    for name, sql, params, expect in HOT_QUERIES:
+        plan = [r["detail"] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        ok = not any("TEMP B-TREE" in d for d in plan)
+        if expect:
+            ok = ok and any(expect in d for d in plan)
+        out.append({"query": name, "ok": ok, "expected_index": expect, "plan": plan})
+    return out
 
-    buckets = {}
-    for tick in ticks:
-        b = (tick["t"] // interval_sec) * interval_sec
-        if b not in buckets:
-            buckets[b] = {
-                "t": b,
-                "time_utc": _epoch_to_iso(b),  # ✅ added
-                "o": tick["p"],
-                "h": tick["p"],
-                "l": tick["p"],
-                "c": tick["p"]
-            }
-        else:
-            d = buckets[b]
-            d["h"] = max(d["h"], tick["p"])
-            d["l"] = min(d["l"], tick["p"])
-            d["c"] = tick["p"]
+# ----------------------------
+# Live updates (pub/sub for /stream)
+# ----------------------------
+# Ingest and control endpoints publish what they just committed; every
+# /stream subscriber gets its own bounded queue. A subscriber that falls
+# behind has its backlog dropped and receives one "resync" message instead,
+# so a slow client never blocks writers or grows memory.
+# Writes handled by other gunicorn workers are picked up by a per-process
+# watcher that polls table_versions and publishes "changed".
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_PING_SEC = float(os.getenv("STREAM_PING_SEC", "15"))
+STREAM_WATCH_SEC = float(os.getenv("STREAM_WATCH_SEC", "2"))
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "4"))    # per process; each holds a worker thread
+STREAM_MAX_SEC = float(os.getenv("STREAM_MAX_SEC", "300"))        # EventSource reconnects by itself
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._watcher_pid = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subs) >= STREAM_MAX_CLIENTS:
+                return None
+            q = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+            self._subs.add(q)
+        self._ensure_watcher()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.discard(q)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, kind: str, payload):
+        with self._lock:
+            subs = list(self._subs)
+        self.published += 1
+        for q in subs:
+            try:
+                q.put_nowait((kind, payload))
+            except queue.Full:
+                self.dropped += 1
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(("resync", {"reason": "client too slow"}))
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name="stream-watcher", daemon=True).start()
+
+    def _watch(self):
+        last = None
+        while True:
+            time.sleep(STREAM_WATCH_SEC)
+            if not self._subs:
+                last = None
+                continue
+            try:
+                with get_conn() as conn:
+                    current = table_versions(conn)
+            except sqlite3.Error:
+                continue
+            if last is not None:
+                changed = sorted(t for t in current if current[t] != last.get(t))
+                if changed:
+                    self.publish("changed", {"tables": changed})
+            last = current
+
+BROKER = Broker()
+
+def _sse(kind: str, payload, event_id=None) -> str:
+    lines = [f"event: {kind}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json_dumps(payload))
+    return "\n".join(lines) + "\n\n"
 
-    out = [buckets[k] for k in sorted(buckets.keys())]
-    return out[-limit:]
+# ----------------------------
+# Retention / downsampling
+# ----------------------------
+# prices, heartbeat and pet get one row per tick/heartbeat forever unless pruned.
+# Policy (0 disables a rule):
+#   RETENTION_PRICES_DAYS          raw ticks older than this are deleted;
+#                                  the candles rollup keeps their history
+#   RETENTION_HEARTBEAT_FULL_HOURS heartbeats older than this keep only the
+#   RETENTION_PET_FULL_HOURS       last row per RETENTION_DOWNSAMPLE_SEC bucket
+# Work runs in a background thread every RETENTION_INTERVAL_SEC, in deletes
+# of at most RETENTION_BATCH rows (one short transaction each) with a pause
+# between them, so the write lock is never held for long. Only one process
+# per database runs it (file lock next to the database).
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+RETENTION_PRICES_DAYS = float(os.getenv("RETENTION_PRICES_DAYS", "30"))
+RETENTION_HEARTBEAT_FULL_HOURS = float(os.getenv("RETENTION_HEARTBEAT_FULL_HOURS", "24"))
+RETENTION_PET_FULL_HOURS = float(os.getenv("RETENTION_PET_FULL_HOURS", "24"))
+RETENTION_DOWNSAMPLE_SEC = int(os.getenv("RETENTION_DOWNSAMPLE_SEC", "60"))
+RETENTION_INTERVAL_SEC = float(os.getenv("RETENTION_INTERVAL_SEC", "300"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "2000"))
+RETENTION_PAUSE_MS = float(os.getenv("RETENTION_PAUSE_MS", "50"))
+RETENTION_WINDOW_SEC = 3600   # downsampling works through one hour of rows at a time
+
+class RetentionEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lock_file = None
+        self._watermarks = {}   # table -> epoch below which downsampling is done
+        self._seen_ids = {}     # table -> highest id the watermark accounts for
+        self.stats = {"runs": 0, "last_run_utc": "", "deleted": {}}
+
+    def ensure_started(self):
+        if not RETENTION_ENABLED or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name="retention", daemon=True).start()
+
+    def _is_leader(self) -> bool:
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(DB_PATH + ".retention.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def _loop(self):
+        while True:
+            time.sleep(RETENTION_INTERVAL_SEC)
+            try:
+                if self._is_leader():
+                    self.run_once()
+            except Exception:
+                app.logger.exception("retention run failed")
+
+    def _pause(self):
+        if RETENTION_PAUSE_MS > 0:
+            time.sleep(RETENTION_PAUSE_MS / 1000.0)
+
+    def _count(self, table: str, n: int):
+        deleted = self.stats["deleted"]
+        deleted[table] = deleted.get(table, 0) + n
+
+    def run_once(self, now: int = None) -> dict:
+        """One pass of every rule; returns rows deleted per table."""
+        now = int(time.time()) if now is None else int(now)
+        before = dict(self.stats["deleted"])
+        if RETENTION_PRICES_DAYS > 0:
+            self._delete_older("prices", now - int(RETENTION_PRICES_DAYS * 86400))
+        if RETENTION_HEARTBEAT_FULL_HOURS > 0:
+            self._downsample("heartbeat", now - int(RETENTION_HEARTBEAT_FULL_HOURS * 3600))
+        if RETENTION_PET_FULL_HOURS > 0:
+            self._downsample("pet", now - int(RETENTION_PET_FULL_HOURS * 3600))
+        self.stats["runs"] += 1
+        self.stats["last_run_utc"] = utc_now_iso()
+        return {t: n - before.get(t, 0) for t, n in self.stats["deleted"].items() if n - before.get(t, 0)}
+
+    def _delete_older(self, table: str, cutoff: int):
+        while True:
+            with get_conn() as conn:
+                n = conn.execute(
+                    f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE time_epoch < ? LIMIT ?)",
+                    (cutoff, RETENTION_BATCH)
+                ).rowcount
+                if n:
+                    touch_tables(conn, [table])
+            self._count(table, n)
+            if n < RETENTION_BATCH:
+                return
+            self._pause()
+
+    def _downsample(self, table: str, cutoff: int):
+        bucket = max(1, RETENTION_DOWNSAMPLE_SEC)
+        cutoff = (cutoff // bucket) * bucket        # never thin a bucket that is still filling
+        start = self._watermarks.get(table)
+        with get_conn() as conn:
+            if start is None:
+                start, top = conn.execute(f"SELECT MIN(time_epoch), MAX(id) FROM {table}").fetchone()
+            else:
+                # Rows written since the last pass may be backfilled behind the watermark.
+                earliest, top = conn.execute(
+                    f"SELECT MIN(time_epoch), MAX(id) FROM {table} WHERE id > ?", (self._seen_ids[table],)
+                ).fetchone()
+                if earliest is not None:
+                    start = min(start, earliest)
+        if start is None:
+            return
+        if top is not None:
+            self._seen_ids[table] = top
+        start = (start // bucket) * bucket
+        window = max(bucket, (RETENTION_WINDOW_SEC // bucket) * bucket)
+        while start < cutoff:
+            end = min(cutoff, start + window)
+            while True:
+                with get_conn() as conn:
+                    n = conn.execute(
+                        f"""
+                        DELETE FROM {table} WHERE id IN (
+                            SELECT id FROM {table}
+                            WHERE time_epoch >= ? AND time_epoch < ?
+                              AND id NOT IN (
+                                SELECT MAX(id) FROM {table}
+                                WHERE time_epoch >= ? AND time_epoch < ?
+                                GROUP BY time_epoch / ?
+                              )
+                            LIMIT ?
+                        )
+                        """,
+                        (start, end, start, end, bucket, RETENTION_BATCH)
+                    ).rowcount
+                    if n:
+                        touch_tables(conn, [table])
+                self._count(table, n)
+                if n:
+                    self._pause()
+                if n < RETENTION_BATCH:
+                    break
+            start = end
+            self._watermarks[table] = start
+
+RETENTION = RetentionEngine()
+
+@app.before_request
+def _start_background_jobs():
+    RETENTION.ensure_started()
 
 # ----------------------------
 # Routes
@@ -387,39 +1818,441 @@ def home():
         "db_parent_exists": os.path.exists(parent),
         "db_path": DB_PATH,
         "endpoints": {
-            "GET": ["/", "/data", "/heartbeat", "/pet", "/events", "/equity", "/trades", "/prices", "/ohlc", "/deaths", "/control"],
+            "GET": ["/", "/debug", "/debug/slow-queries", "/metrics", "/stream", "/data", "/heartbeat", "/pet", "/events", "/equity", "/trades", "/prices", "/ohlc", "/stats/markets", "/deaths", "/control"],
             "POST": [
-                "/ingest/heartbeat", "/ingest/pet", "/ingest/event", "/ingest/equity", "/ingest/trade", "/ingest/prices", "/ingest/death",
+                "/ingest/heartbeat", "/ingest/pet", "/ingest/event", "/ingest/equity", "/ingest/trade", "/ingest/prices", "/ingest/death", "/ingest/batch",
                 "/control/pause", "/control/cryo", "/control/revive"
             ],
             "DELETE": ["/reset/all", "/reset/events", "/reset/trades", "/reset/equity", "/reset/deaths"]
         }
     })
 
+@app.get("/debug")
+def debug():
+    with get_conn() as conn:
+        pragmas = effective_pragmas(conn)
+        schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        plans = check_query_plans(conn)
+    return jsonify({
+        "sqlite_version": sqlite3.sqlite_version,
+        "db_path": DB_PATH,
+        "schema_version": schema_version,
+        "pragmas": {"configured": PRAGMAS, "effective": pragmas},
+        "query_plans": plans,
+        "pool": {"size": POOL.size, "idle": len(POOL._idle), **POOL.stats},
+        "ohlc_engine": OHLC_ENGINE,
+        "data_cache": {"hits": DATA_CACHE.hits, "misses": DATA_CACHE.misses},
+        "delta_cache": {"hits": DELTA_CACHE.hits, "misses": DELTA_CACHE.misses},
+        "selection_cache": {"hits": SELECTION_CACHES.hits, "misses": SELECTION_CACHES.misses,
+                            "selections": len(SELECTION_CACHES._caches), "capacity": SELECTION_CACHES.size},
+        "stream": {"subscribers": BROKER.subscribers, "published": BROKER.published, "dropped": BROKER.dropped},
+        "retention": {"enabled": RETENTION_ENABLED, **RETENTION.stats},
+        "write_behind": {"enabled": WRITE_BEHIND, "ack": WRITE_BEHIND_ACK, "depth": WRITE_QUEUE.depth,
+                         "capacity": WRITE_BEHIND_QUEUE_SIZE, **WRITE_QUEUE.stats},
+    })
+
+@app.get("/debug/slow-queries")
+def debug_slow_queries():
+    """Newest first. ?clear=1 empties the buffer after reading it."""
+    queries = list(SLOW_QUERIES)[::-1]
+    if request.args.get("clear") in ("1", "true", "yes"):
+        SLOW_QUERIES.clear()
+    return jsonify({"threshold_ms": SLOW_QUERY_MS, "capacity": SLOW_QUERY_LOG_SIZE, "pid": os.getpid(), "queries": queries})
+
+@app.get("/metrics")
+def metrics():
+    samples = []
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            size = os.path.getsize(DB_PATH + suffix)
+        except OSError:
+            continue
+        samples.append(("db_file_bytes", "gauge", (("file", "db" + suffix),), size))
+    for name, cache in (("data", DATA_CACHE), ("delta", DELTA_CACHE), ("selection", SELECTION_CACHES)):
+        samples.append(("cache_requests_total", "counter", (("cache", name), ("result", "hit")), cache.hits))
+        samples.append(("cache_requests_total", "counter", (("cache", name), ("result", "miss")), cache.misses))
+    samples.append(("db_pool_connections", "gauge", (("state", "idle"),), len(POOL._idle)))
+    samples.append(("db_pool_connections", "gauge", (("state", "in_use"),), POOL.stats["in_use"]))
+    samples.append(("stream_subscribers", "gauge", (), BROKER.subscribers))
+    samples.append(("write_queue_depth", "gauge", (), WRITE_QUEUE.depth))
+    return Response(METRICS.render(samples), mimetype="text/plain; version=0.0.4")
+
+@app.get("/stream")
+def stream():
+    """
+    Server-Sent Events: heartbeat, pet, trade, equity, prices, event, death and
+    control messages carry what was just ingested by this worker; "changed"
+    lists tables written by any worker; "resync" means refetch /data; "ping"
+    is a keepalive.
+    """
+    q = BROKER.subscribe()
+    if q is None:
+        return jsonify({"ok": False, "error": "too many stream clients, poll /data instead"}), 503
+
+    def events():
+        seq = 0
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse("ping", {"time_utc": utc_now_iso()})
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < STREAM_MAX_SEC:
+                try:
+                    kind, payload = q.get(timeout=1.0)
+                except queue.Empty:
+                    if time.monotonic() - last_sent >= STREAM_PING_SEC:
+                        last_sent = time.monotonic()
+                        yield _sse("ping", {"time_utc": utc_now_iso()})
+                    continue
+                seq += 1
+                last_sent = time.monotonic()
+                yield _sse(kind, payload, event_id=seq)
+        finally:
+            BROKER.unsubscribe(q)
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",   # don't let a reverse proxy buffer the stream
+    })
+
 @app.get("/control")
 def control_get():
-    return jsonify(get_control())
+    return versioned_json(["control"], get_control)
+
+# ----------------------------
+# /data snapshot cache
+# ----------------------------
+# Every open dashboard tab polls /data. The encoded payload is cached per
+# process and keyed by the versions of the tables it reads, so N viewers
+# cost one build per write instead of one build per poll.
+DATA_TABLES = ("control", "heartbeat", "pet", "equity", "trades", "prices", "events", "deaths", "market_stats")
+
+class SnapshotCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entry = (None, None)   # (key, value) swapped as one object
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        cached_key, value = self._entry
+        if cached_key == key:
+            self.hits += 1
+            return value
+        # Concurrent misses for the same key wait here and reuse one build.
+        with self._lock:
+            cached_key, value = self._entry
+            if cached_key == key:
+                self.hits += 1
+                return value
+            self.misses += 1
+            value = build()
+            self._entry = (key, value)
+            return value
+
+    def clear(self):
+        self._entry = (None, None)
+
+class SelectionCaches:
+    """One SnapshotCache per /data selection; the least recently used is dropped past `size`."""
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._caches = collections.OrderedDict()
+        self._evicted = [0, 0]   # hits, misses of dropped caches, so the totals never go backwards
+
+    def get(self, key) -> SnapshotCache:
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is not None:
+                self._caches.move_to_end(key)
+                return cache
+            cache = self._caches[key] = SnapshotCache()
+            while len(self._caches) > self.size:
+                _, old = self._caches.popitem(last=False)
+                self._evicted[0] += old.hits
+                self._evicted[1] += old.misses
+            return cache
+
+    @property
+    def hits(self):
+        return self._evicted[0] + sum(c.hits for c in list(self._caches.values()))
+
+    @property
+    def misses(self):
+        return self._evicted[1] + sum(c.misses for c in list(self._caches.values()))
+
+DATA_CACHE = SnapshotCache()
+DELTA_CACHE = SnapshotCache()   # viewers that saw the same snapshot poll with the same cursor
+SELECTION_CACHE_SIZE = int(os.getenv("SELECTION_CACHE_SIZE", "32"))
+SELECTION_CACHES = SelectionCaches(SELECTION_CACHE_SIZE)
+
+# ----------------------------
+# /data delta cursors
+# ----------------------------
+# Row-list sections of /data and how many rows a full load returns.
+# A cursor maps each of them to [generation, last id seen]; ids come from
+# AUTOINCREMENT so they never go backwards, and a generation change
+# (table wiped) tells the client to replace that section.
+DATA_SECTIONS = {"equity": 200, "trades": 80, "prices": 800, "events": 250, "deaths": 200}
+
+def encode_cursor(cursor: dict) -> str:
+    raw = json.dumps(cursor, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        parsed = json.loads(raw)
+        return {t: (int(v[0]), int(v[1])) for t, v in parsed.items() if t in DATA_SECTIONS}
+    except (ValueError, TypeError, IndexError, AttributeError):
+        raise ValueError("invalid cursor")
+
+# ----------------------------
+# /data section selection
+# ----------------------------
+# ?include=heartbeat,pet,equity returns only those top-level keys (plus the
+# cursor fields); ?fields=trades:time_utc,market,pnl_usd keeps only those
+# fields of a section's rows and includes the section. Several projections
+# are separated by ";" or given as repeated fields= args. Each key lists the
+# tables it is built from: tables no selected key needs are not queried and
+# their writes do not change the ETag.
+DATA_KEYS = {
+    "control": ("control",),
+    "state": ("control",),
+    "heartbeat": ("heartbeat",),
+    "pet": ("pet",),
+    "equity": ("equity",),
+    "trades": ("trades",),
+    "prices": ("prices",),
+    "events": ("events",),
+    "deaths": ("deaths",),
+    "stats": ("control", "trades"),
+    "per_market": ("market_stats",),
+    "total_trades": ("market_stats",),
+    "wins": ("market_stats",),
+    "losses": ("market_stats",),
+    "win_rate": ("market_stats",),
+    "total_pnl_usd": ("market_stats",),
+    "equity_curve": ("equity",),
+    "recent_trades": ("trades",),
+    "bot_status": ("heartbeat",),
+}
+DATA_ALWAYS = ("cursor", "delta", "reset")
+DATA_SCALARS = ("state", "total_trades", "wins", "losses", "win_rate", "total_pnl_usd")
+
+def parse_data_selection(args):
+    """
+    (include, fields) from the query args, both normalised to sorted tuples so
+    the same selection gives the same cache key and ETag in every worker.
+    include is None when every key is wanted.
+    """
+    include = None
+    if "include" in args:
+        include = {k.strip() for k in args["include"].split(",") if k.strip()}
+        if not include:
+            raise ValueError("include must name at least one key")
+    fields = {}
+    for arg in args.getlist("fields"):
+        for spec in arg.split(";"):
+            if not spec.strip():
+                continue
+            key, sep, names = spec.partition(":")
+            key = key.strip()
+            names = [n.strip() for n in names.split(",") if n.strip()]
+            if not sep or not names:
+                raise ValueError("fields must look like section:field,field")
+            if key in DATA_SCALARS:
+                raise ValueError(f"{key} has no fields")
+            fields.setdefault(key, {}).update(dict.fromkeys(names))
+    unknown = sorted(((include or set()) | set(fields)) - set(DATA_KEYS))
+    if unknown:
+        raise ValueError(f"unknown /data keys: {', '.join(unknown)}")
+    if include is not None:
+        include = tuple(sorted(include | set(fields)))
+    return include, tuple(sorted((k, tuple(names)) for k, names in fields.items()))
+
+def data_tables(include):
+    if include is None:
+        return DATA_TABLES
+    return tuple(t for t in DATA_TABLES if any(t in DATA_KEYS[k] for k in include))
+
+def _project(value, names):
+    if isinstance(value, dict):
+        return {n: value[n] for n in names if n in value}
+    return [{n: r[n] for n in names if n in r} for r in value]
+
+# ----------------------------
+# Conditional GET (ETag / Last-Modified) and compression
+# ----------------------------
+# Bodies of at least COMPRESS_MIN_BYTES are sent gzip- (or brotli-, when the
+# module is installed) encoded if the client accepts it. A cached body keeps
+# its compressed variants next to it, so each data version is compressed
+# once per encoding, not once per viewer. Each encoding gets its own strong
+# ETag (suffix -gzip / -br) as required for different representations.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "5"))
+COMPRESS_ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+class EncodedBody:
+    """A response body plus its compressed variants, each built on first use."""
+    __slots__ = ("raw", "_variants", "_lock")
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def get(self, encoding):
+        if encoding is None:
+            return self.raw
+        body = self._variants.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._variants.get(encoding)
+                if body is None:
+                    METRICS.inc("compress_total", (("encoding", encoding),))
+                    if encoding == "br":
+                        body = brotli.compress(self.raw, quality=COMPRESS_BR_QUALITY)
+                    else:
+                        body = gzip.compress(self.raw, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+                    self._variants[encoding] = body
+        return body
+
+def _encode_json(obj) -> bytes:
+    return app.json.response(obj).get_data()
+
+def _negotiate_encoding():
+    if COMPRESS_MIN_BYTES <= 0:
+        return None
+    return request.accept_encodings.best_match(COMPRESS_ENCODINGS)
+
+def versioned_json(tables, build, extra=None, cache=None):
+    """
+    Serve build() as JSON with a strong ETag and Last-Modified derived from the
+    versions of `tables`. Answers 304 without calling build() when the client
+    already holds the current representation.
+    extra: anything else the body depends on (query args, control state).
+    cache: optional SnapshotCache for the encoded (and compressed) body.
+    """
+    encoding = _negotiate_encoding()
+    with get_conn() as conn:
+        conn.execute("BEGIN")   # versions and body come from one read snapshot
+        versions = table_versions(conn)
+        key = (request.path, extra) + tuple(versions.get(t) for t in tables)
+        etag = hashlib.blake2b(repr(key).encode(), digest_size=10).hexdigest()
+        last_modified = max([versions[t][2] for t in tables if t in versions] or [0])
+
+        matched = None
+        if request.if_none_match:
+            # Any encoding of the current version is still current.
+            matched = next((t for t in [etag] + [f"{etag}-{e}" for e in COMPRESS_ENCODINGS]
+                            if request.if_none_match.contains(t)), None)
+            not_modified = matched is not None
+        else:
+            # Second-resolution timestamps: never validate the current second.
+            ims = request.if_modified_since
+            not_modified = bool(ims and last_modified and last_modified < int(time.time())
+                                and ims.timestamp() >= last_modified)
+
+        if not_modified:
+            resp = app.response_class(status=304)
+        else:
+            if cache is not None:
+                body = cache.get_or_build(key, lambda: EncodedBody(_encode_json(build())))
+            else:
+                body = EncodedBody(_encode_json(build()))
+            if len(body.raw) < COMPRESS_MIN_BYTES:
+                encoding = None
+            resp = app.response_class(body.get(encoding), mimetype=app.json.mimetype)
+            if encoding:
+                resp.headers["Content-Encoding"] = encoding
+            matched = f"{etag}-{encoding}" if encoding else etag
+
+    resp.set_etag(matched or etag)
+    if last_modified:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.vary.add("Accept-Encoding")
+    return resp
 
 @app.get("/data")
 def data():
+    """
+    Full dashboard snapshot. With ?since=<cursor> (taken from a previous
+    response's "cursor"), row lists only carry rows newer than the cursor;
+    sections named in "reset" were reloaded in full and replace the client's copy.
+    ?include=key,key and ?fields=section:field,field select parts of it (see DATA_KEYS).
+    """
+    try:
+        include, fields = parse_data_selection(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    selected = include is not None or bool(fields)
+    tables = data_tables(include)
     state, ctrl = is_paused_or_cryo()
 
-    hb = fetch_one("heartbeat")
-    pet = fetch_one("pet")
-
-    equity_points = fetch_many("equity", limit=200, order_by="id DESC")
+    since = request.args.get("since")
+    if since:
+        try:
+            cursor = decode_cursor(since)
+        except ValueError:
+            return jsonify({"ok": False, "error": "invalid cursor"}), 400
+        cache = SELECTION_CACHES.get(("delta", include, fields)) if selected else DELTA_CACHE
+        return versioned_json(tables, lambda: build_data_payload(state, ctrl, cursor, include, fields),
+                              extra=(state, since, include, fields), cache=cache)
+
+    cache = SELECTION_CACHES.get(("full", include, fields)) if selected else DATA_CACHE
+    return versioned_json(tables, lambda: build_data_payload(state, ctrl, None, include, fields),
+                          extra=(state, include, fields) if selected else state, cache=cache)
+
+def _data_section_rows(since, versions, tables=DATA_TABLES):
+    """Rows per DATA_SECTIONS table (newest first), the sections reloaded in full, and the next cursor."""
+    rows, reset, next_cursor = {}, [], {}
+    for table, limit in DATA_SECTIONS.items():
+        if table not in tables:
+            continue
+        generation = versions.get(table, (0, 0, 0))[1]
+        prev = since.get(table) if since is not None else None
+        if prev is not None and prev[0] == generation:
+            got = fetch_since(table, prev[1], limit=limit + 1)
+            last_id = prev[1]
+            if len(got) > limit:
+                # More new rows than a full load holds: send a full section instead of a gap.
+                got = got[:limit]
+                reset.append(table)
+        else:
+            got = fetch_many(table, limit=limit, order_by="id DESC")
+            last_id = 0
+            if since is not None:
+                reset.append(table)
+        rows[table] = got
+        next_cursor[table] = [generation, max([r["id"] for r in got] or [last_id])]
+    return rows, reset, next_cursor
+
+def build_data_payload(state, ctrl, since=None, include=None, fields=()):
+    """include/fields: a selection from parse_data_selection(); unselected tables are not read."""
+    tables = data_tables(include)
+    with get_conn() as conn:
+        versions = table_versions(conn)
+    rows, reset, next_cursor = _data_section_rows(since, versions, tables)
+
+    hb = fetch_one("heartbeat") if "heartbeat" in tables else None
+    pet = fetch_one("pet") if "pet" in tables else None
+
+    equity_points = rows.get("equity", [])
     equity_points.reverse()
 
-    recent_trades = fetch_many("trades", limit=80, order_by="id DESC")
+    recent_trades = rows.get("trades", [])
 
-    latest_prices = fetch_many("prices", limit=800, order_by="id DESC")
+    latest_prices = rows.get("prices", [])
 
-    events = fetch_many("events", limit=250, order_by="id DESC")
+    events = rows.get("events", [])
     events.reverse()
     for e in events:
         e["details"] = _safe_json_loads(e.get("details"))
 
-    deaths = fetch_many("deaths", limit=200, order_by="id DESC")
+    deaths = rows.get("deaths", [])
     deaths.reverse()
     for d in deaths:
         d["details"] = _safe_json_loads(d.get("details"))
@@ -429,13 +2262,21 @@ def data():
         hb["prices_ok"] = int(hb.get("prices_ok") or 0)
 
     total_trades = len(recent_trades)
-
-    return jsonify({
+    if "market_stats" in tables:
+        per_market, totals = market_stats()
+    else:
+        per_market, totals = [], {"trades": 0, "wins": 0, "losses": 0, "win_rate": 0.0, "total_pnl_usd": 0.0}
+    equity_curve = [{"equity_usd": float(p["equity_usd"]), "time_utc": p["time_utc"]} for p in equity_points]
+
+    payload = {
+        "cursor": encode_cursor(next_cursor),
+        "delta": since is not None,
+        "reset": reset,
         "control": ctrl,
         "state": state,
         "heartbeat": hb or {},
         "pet": pet or {},
-        "equity": [{"equity_usd": float(p["equity_usd"]), "time_utc": p["time_utc"]} for p in equity_points],
+        "equity": equity_curve,
         "trades": [
             {
                 "time_utc": t["time_utc"],
@@ -459,73 +2300,183 @@ def data():
             "cryo_until_utc": ctrl.get("cryo_until_utc",""),
             "cryo_reason": ctrl.get("cryo_reason",""),
             "total_trades_loaded": total_trades,
-        }
-    })
+        },
+        # Dashboard aggregates: totals over all trades, from market_stats.
+        "per_market": per_market,
+        "total_trades": totals["trades"],
+        "wins": totals["wins"],
+        "losses": totals["losses"],
+        "win_rate": totals["win_rate"],
+        "total_pnl_usd": totals["total_pnl_usd"],
+        "equity_curve": equity_curve,
+        "recent_trades": [
+            {"time": t["time_utc"], "market": t["market"], "pnl_usd": float(t.get("pnl_usd") or 0)}
+            for t in recent_trades[:20]
+        ],
+        "bot_status": {
+            "status": (hb or {}).get("status", "unknown"),
+            "last_heartbeat": (hb or {}).get("time_utc", ""),
+        },
+    }
+    if include is not None:
+        payload = {k: v for k, v in payload.items() if k in include or k in DATA_ALWAYS}
+    for key, names in fields:
+        payload[key] = _project(payload[key], names)
+    return payload
+
+@app.get("/stats/markets")
+def stats_markets():
+    def build():
+        per_market, totals = market_stats()
+        return {"markets": per_market, "totals": totals}
+    return versioned_json(["market_stats"], build)
 
 @app.get("/ohlc")
 def ohlc():
-    market = request.args.get("market", "BTCUSDT")
+    """
+    ?market=BTCUSDT or ?markets=BTCUSDT,ETHUSDT (response keyed by market),
+    &interval=60&limit=200&from=&to=&fill=1
+    """
     interval = int(request.args.get("interval", "60"))
     limit = int(request.args.get("limit", "200"))
-    candles = compute_ohlc(market=market, interval_sec=interval, limit=limit)
-    return jsonify({
+    fill = request.args.get("fill", "").strip().lower() in ("1", "true", "yes", "on")
+    try:
+        from_epoch, to_epoch = _time_arg("from"), _time_arg("to")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    extra = (interval, limit, from_epoch, to_epoch, fill)
+
+    if "markets" in request.args:
+        markets = [m.strip() for m in request.args["markets"].split(",") if m.strip()]
+        if not markets:
+            return jsonify({"ok": False, "error": "markets must list at least one market"}), 400
+        if len(markets) > OHLC_MAX_MARKETS:
+            return jsonify({"ok": False, "error": f"at most {OHLC_MAX_MARKETS} markets per request"}), 400
+        return versioned_json(["prices", "candles"], lambda: {
+            "interval_sec": interval,
+            "markets": compute_ohlc_many(markets, interval, limit, from_epoch, to_epoch, fill)
+        }, extra=(tuple(markets),) + extra)
+
+    market = request.args.get("market", "BTCUSDT")
+    return versioned_json(["prices", "candles"], lambda: {
         "market": market,
         "interval_sec": interval,
-        "candles": candles
-    })
+        "candles": compute_ohlc(market, interval, limit, from_epoch, to_epoch, fill)
+    }, extra=(market,) + extra)
 
 @app.get("/heartbeat")
 def get_heartbeat():
-    return jsonify(fetch_one("heartbeat") or {})
+    return versioned_json(["heartbeat"], lambda: fetch_one("heartbeat") or {})
 
 @app.get("/pet")
 def get_pet():
-    return jsonify(fetch_one("pet") or {})
+    return versioned_json(["pet"], lambda: fetch_one("pet") or {})
+
+# ----------------------------
+# History pages (keyset pagination)
+# ----------------------------
+# ?limit=&before_id=&after_id=&from=&to= on the list endpoints. Without any of
+# them the response is the same latest-N list as before. The next page is
+# advertised in the Link header (rel="next") and X-Next-Before-Id /
+# X-Next-After-Id; it is omitted when the page came back short.
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "5000"))
+
+def _page_args(default_limit: int) -> dict:
+    def id_arg(name):
+        v = request.args.get(name)
+        if v is None or v == "":
+            return None
+        try:
+            i = int(v)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+        if not INT64_MIN <= i <= INT64_MAX:
+            raise ValueError(f"{name} must be an integer")
+        return i
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    args = {
+        "limit": max(1, min(limit, PAGE_MAX_LIMIT)),
+        "before_id": id_arg("before_id"),
+        "after_id": id_arg("after_id"),
+        "from_epoch": _time_arg("from"),
+        "to_epoch": _time_arg("to"),
+    }
+    if args["before_id"] is not None and args["after_id"] is not None:
+        raise ValueError("use before_id or after_id, not both")
+    return args
+
+def paged_json(table: str, default_limit: int, transform=None, oldest_first=False):
+    try:
+        args = _page_args(default_limit)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    page = {}
+    def build():
+        rows = fetch_page(table, **args)
+        if len(rows) == args["limit"]:
+            if args["after_id"] is not None:
+                page["after_id"] = rows[0]["id"]
+            else:
+                page["before_id"] = rows[-1]["id"]
+        if transform:
+            for r in rows:
+                transform(r)
+        if oldest_first:
+            rows.reverse()
+        return rows
+
+    resp = versioned_json([table], build, extra=tuple(sorted(args.items())))
+    for key, value in page.items():
+        q = {k: v for k, v in request.args.items() if k not in ("before_id", "after_id")}
+        q[key] = value
+        q["limit"] = args["limit"]
+        resp.headers["Link"] = f'<{request.base_url}?{urlencode(q)}>; rel="next"'
+        resp.headers["X-Next-Before-Id" if key == "before_id" else "X-Next-After-Id"] = str(value)
+    return resp
+
+def _decode_details(row):
+    row["details"] = _safe_json_loads(row.get("details"))
 
 @app.get("/events")
 def get_events():
-    ev = fetch_many("events", limit=250)
-    for e in ev:
-        e["details"] = _safe_json_loads(e.get("details"))
-    return jsonify(ev)
+    return paged_json("events", 250, transform=_decode_details)
 
 @app.get("/equity")
 def get_equity():
-    points = fetch_many("equity", limit=400, order_by="id DESC")
-    points.reverse()
-    return jsonify(points)
+    return paged_json("equity", 400, oldest_first=True)
 
 @app.get("/trades")
 def get_trades():
-    return jsonify(fetch_many("trades", limit=300))
+    return paged_json("trades", 300)
 
 @app.get("/prices")
 def get_prices():
-    return jsonify(fetch_many("prices", limit=1000))
+    return paged_json("prices", 1000)
 
 @app.get("/deaths")
 def get_deaths():
-    d = fetch_many("deaths", limit=300)
-    for x in d:
-        x["details"] = _safe_json_loads(x.get("details"))
-    return jsonify(d)
+    return paged_json("deaths", 300, transform=_decode_details)
 
 # ----------------------------
-# Ingest endpoints
+# Ingest: record builders
 # ----------------------------
-@app.post("/ingest/equity")
-def ingest_equity():
-    body = request.get_json(force=True, silent=True) or {}
-    equity_usd = float(body.get("equity_usd", 0))
+# One builder per record kind turns a request body into rows for its table
+# (plus rejected entries, for prices). apply_ingest() writes the rows and the
+# data derived from them. The single-record endpoints and /ingest/batch share both.
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))          # records per transaction
+BATCH_MAX_RECORDS = int(os.getenv("BATCH_MAX_RECORDS", "100000"))    # per request
+
+def _equity_rows(body):
     time_utc = body.get("time_utc") or utc_now_iso()
-    insert_row("equity", {"time_utc": time_utc, "time_epoch": _to_epoch(time_utc), "equity_usd": equity_usd})
-    return jsonify({"ok": True})
+    return [{"time_utc": time_utc, "time_epoch": _to_epoch(time_utc), "equity_usd": float(body.get("equity_usd", 0))}], []
 
-@app.post("/ingest/heartbeat")
-def ingest_heartbeat():
-    body = request.get_json(force=True, silent=True) or {}
+def _heartbeat_rows(body):
     time_utc = body.get("time_utc") or utc_now_iso()
-    row = {
+    return [{
         "time_utc": time_utc,
         "time_epoch": _to_epoch(time_utc),
         "equity_usd": float(body.get("equity_usd", 0)),
@@ -533,20 +2484,16 @@ def ingest_heartbeat():
         "losses": int(body.get("losses", 0)),
         "total_trades": int(body.get("total_trades", 0)),
         "total_pnl_usd": float(body.get("total_pnl_usd", 0)),
-        "markets": json.dumps(body.get("markets", [])),
+        "markets": json_dumps(body.get("markets", [])),
         "open_positions": int(body.get("open_positions", 0)),
         "prices_ok": int(bool(body.get("prices_ok", False))),
         "status": body.get("status", "running"),
         "survival_mode": body.get("survival_mode", "NORMAL"),
-    }
-    insert_row("heartbeat", row)
-    return jsonify({"ok": True})
+    }], []
 
-@app.post("/ingest/pet")
-def ingest_pet():
-    body = request.get_json(force=True, silent=True) or {}
+def _pet_rows(body):
     time_utc = body.get("time_utc") or utc_now_iso()
-    row = {
+    return [{
         "time_utc": time_utc,
         "time_epoch": _to_epoch(time_utc),
         "fainted_until_utc": body.get("fainted_until_utc", "") or "",
@@ -556,15 +2503,11 @@ def ingest_pet():
         "mood": body.get("mood", "neutral"),
         "stage": body.get("stage", "egg"),
         "sex": body.get("sex", "boy"),
-    }
-    insert_row("pet", row)
-    return jsonify({"ok": True})
+    }], []
 
-@app.post("/ingest/trade")
-def ingest_trade():
-    body = request.get_json(force=True, silent=True) or {}
+def _trade_rows(body):
     time_utc = body.get("time_utc") or utc_now_iso()
-    row = {
+    return [{
         "time_utc": time_utc,
         "time_epoch": _to_epoch(time_utc),
         "market": body.get("market", "BTCUSDT"),
@@ -574,59 +2517,467 @@ def ingest_trade():
         "pnl_usd": float(body.get("pnl_usd", 0)),
         "confidence": float(body.get("confidence", 0)),
         "reason": body.get("reason", "") or "",
-    }
-    insert_row("trades", row)
-    return jsonify({"ok": True})
+    }], []
 
-@app.post("/ingest/prices")
-def ingest_prices():
-    body = request.get_json(force=True, silent=True) or {}
+def _prices_rows(body):
     time_utc = body.get("time_utc") or utc_now_iso()
     time_epoch = _to_epoch(time_utc)
 
     prices = body.get("prices", None)
     if prices is None:
-        prices = body
+        # Flat form: {"BTCUSDT": 1.0, ..., "time_utc": "..."}
+        prices = {k: v for k, v in body.items() if k not in ("time_utc", "kind")}
 
     if not isinstance(prices, dict):
-        return jsonify({"ok": False, "error": "prices must be a dict"}), 400
-
-    count = 0
-    for market, price in prices.items():
-        try:
-            insert_row("prices", {"time_utc": time_utc, "time_epoch": time_epoch, "market": str(market), "price": float(price)})
-            count += 1
-        except Exception:
-            pass
-
-    return jsonify({"ok": True, "count": count})
-
-@app.post("/ingest/event")
-def ingest_event():
-    body = request.get_json(force=True, silent=True) or {}
+        raise ValueError("prices must be a dict")
+
+    rows = []
+    rejected = []
+    for market, raw_price in prices.items():
+        market = str(market).strip()
+        price, error = _parse_price(raw_price)
+        if not market:
+            error = "empty market"
+        if error:
+            if isinstance(raw_price, float) and not math.isfinite(raw_price):
+                raw_price = str(raw_price)  # keep the response valid JSON
+            rejected.append({"market": market, "price": raw_price, "error": error})
+            continue
+        rows.append({"time_utc": time_utc, "time_epoch": time_epoch, "market": market, "price": price})
+    return rows, rejected
+
+def _event_rows(body):
     t = body.get("time_utc") or utc_now_iso()
-    insert_row("events", {
+    return [{
         "time_utc": t,
         "time_epoch": _to_epoch(t),
         "type": body.get("type", "info"),
         "message": body.get("message", "") or "",
-        "details": json.dumps(body.get("details", {}))
-    })
-    return jsonify({"ok": True})
+        "details": json_dumps(body.get("details", {}))
+    }], []
 
-@app.post("/ingest/death")
-def ingest_death():
-    body = request.get_json(force=True, silent=True) or {}
+def _death_rows(body):
     t = body.get("time_utc") or utc_now_iso()
-    insert_row("deaths", {
+    return [{
         "time_utc": t,
         "time_epoch": _to_epoch(t),
         "source": body.get("source", "bot"),
         "reason": body.get("reason", "") or "",
-        "details": json.dumps(body.get("details", {}))
-    })
-    add_event("warning", "Death/Cryo record added", {"reason": body.get("reason",""), "source": body.get("source","bot")})
-    return jsonify({"ok": True})
+        "details": json_dumps(body.get("details", {}))
+    }], []
+
+# kind -> (table, builder)
+INGEST_KINDS = {
+    "equity": ("equity", _equity_rows),
+    "heartbeat": ("heartbeat", _heartbeat_rows),
+    "pet": ("pet", _pet_rows),
+    "trade": ("trades", _trade_rows),
+    "prices": ("prices", _prices_rows),
+    "event": ("events", _event_rows),
+    "death": ("deaths", _death_rows),
+}
+
+def build_ingest_rows(kind: str, body):
+    """(rows, rejected) for one record; raises ValueError/TypeError if it is unusable."""
+    if not isinstance(body, dict):
+        raise ValueError("record must be a JSON object")
+    return INGEST_KINDS[kind][1](body)
+
+def apply_ingest(conn, kind: str, rows):
+    """Write rows of one kind plus derived data; runs inside the caller's transaction."""
+    if not rows:
+        return
+    insert_many(INGEST_KINDS[kind][0], rows)
+    if kind == "prices":
+        rollup_ticks(conn, rows)
+    elif kind == "trade":
+        add_market_stats(conn, rows)
+    elif kind == "death":
+        for r in rows:
+            add_event("warning", "Death/Cryo record added", {"reason": r["reason"], "source": r["source"]})
+
+def count_ingested(kind: str, rows):
+    """ingest_rows_total; call once the rows are committed, so retried rows are not counted twice."""
+    if rows:
+        METRICS.inc("ingest_rows_total", (("table", INGEST_KINDS[kind][0]),), len(rows))
+
+def apply_ingest_group(items) -> list:
+    """
+    Write [(kind, rows), ...] in one transaction. If that fails, retry each
+    item in its own transaction so one bad record cannot sink the rest.
+    Returns one error per item (None = committed).
+    """
+    by_kind = {}
+    for kind, rows in items:
+        by_kind.setdefault(kind, []).extend(rows)
+    try:
+        with get_conn() as conn:
+            for kind, rows in by_kind.items():
+                apply_ingest(conn, kind, rows)
+        for kind, rows in by_kind.items():
+            count_ingested(kind, rows)
+        return [None] * len(items)
+    except Exception as e:
+        if len(items) == 1:
+            app.logger.warning("ingest: dropping %s record: %s", items[0][0], e)
+            return [e]
+    errors = []
+    for kind, rows in items:
+        try:
+            with get_conn() as conn:
+                apply_ingest(conn, kind, rows)
+            count_ingested(kind, rows)
+            errors.append(None)
+        except Exception as e:
+            app.logger.warning("ingest: dropping %s record: %s", kind, e)
+            errors.append(e)
+    return errors
+
+def publish_ingest(kind: str, rows):
+    """Tell /stream subscribers about rows that were just committed."""
+    if not rows:
+        return
+    if kind == "prices":
+        by_time = {}
+        for r in rows:
+            by_time.setdefault(r["time_utc"], {})[r["market"]] = r["price"]
+        for time_utc, prices in by_time.items():
+            BROKER.publish("prices", {"time_utc": time_utc, "prices": prices})
+        return
+    for r in rows:
+        if kind == "event":
+            BROKER.publish("event", {"time_utc": r["time_utc"], "type": r["type"], "message": r["message"]})
+        elif kind == "death":
+            BROKER.publish("death", {"time_utc": r["time_utc"], "source": r["source"], "reason": r["reason"]})
+        else:
+            BROKER.publish(kind, r)
+
+# ----------------------------
+# Write-behind queue (optional)
+# ----------------------------
+# With WRITE_BEHIND=1 the single-record ingest endpoints hand validated rows
+# to a bounded in-process queue. One writer thread drains it: each commit takes
+# everything already queued (up to WRITE_BEHIND_BATCH_ROWS rows), and lingers
+# up to WRITE_BEHIND_BATCH_MS for more before committing a short group.
+# WRITE_BEHIND_ACK picks durability:
+#   commit  -- respond once the group holding the rows has committed (default;
+#              no linger by default, since every waiting request would pay it)
+#   enqueue -- respond as soon as the rows are queued; a crash loses the queue
+# A full queue answers 503 so the bot backs off. Once the queue is closed at
+# shutdown, records are written synchronously instead. /ingest/batch already
+# group-commits and always writes synchronously.
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0").strip().lower() in ("1", "true", "yes", "on")
+WRITE_BEHIND_ACK = os.getenv("WRITE_BEHIND_ACK", "commit").strip().lower()
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))   # records
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH_ROWS", "500"))
+if WRITE_BEHIND_ACK not in ("commit", "enqueue"):
+    raise ValueError(f"WRITE_BEHIND_ACK must be 'commit' or 'enqueue', not {WRITE_BEHIND_ACK!r}")
+WRITE_BEHIND_BATCH_MS = float(os.getenv("WRITE_BEHIND_BATCH_MS", "0" if WRITE_BEHIND_ACK == "commit" else "25"))
+WRITE_BEHIND_ACK_TIMEOUT = float(os.getenv("WRITE_BEHIND_ACK_TIMEOUT", "10"))
+
+class WriteTicket:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout: float) -> bool:
+        return self.done.wait(timeout)
+
+class WriteQueueClosed(Exception):
+    pass
+
+class WriteBehindQueue:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        self._q = queue.Queue(maxsize=self.maxsize)
+        self._thread = None
+        self.closed = False
+        self.stats = {"enqueued": 0, "rejected_full": 0, "commits": 0, "committed_rows": 0, "failed": 0, "max_depth": 0}
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._reset()
+            if not self.closed and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, kind: str, rows) -> WriteTicket:
+        """
+        Queue rows of one kind; raises queue.Full when the queue is at capacity
+        and WriteQueueClosed once close() has run.
+        """
+        self._ensure_writer()
+        ticket = WriteTicket()
+        with self._lock:
+            # Checked under the lock close() takes, so nothing lands behind the stop marker.
+            if self.closed:
+                raise WriteQueueClosed()
+            try:
+                self._q.put_nowait((kind, rows, ticket))
+            except queue.Full:
+                self.stats["rejected_full"] += 1
+                raise
+            self.stats["enqueued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], self._q.qsize())
+        return ticket
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            group, nrows, stop = [item], len(item[1]), False
+            deadline = time.monotonic() + WRITE_BEHIND_BATCH_MS / 1000.0
+            while nrows < WRITE_BEHIND_BATCH_ROWS:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+                nrows += len(item[1])
+            self._commit(group)
+            if stop:
+                return
+
+    def _commit(self, group):
+        errors = apply_ingest_group([(kind, rows) for kind, rows, _ticket in group])
+        self.stats["commits"] += 1
+        for (kind, rows, ticket), error in zip(group, errors):
+            if error is None:
+                self.stats["committed_rows"] += len(rows)
+                publish_ingest(kind, rows)
+            else:
+                self.stats["failed"] += 1
+            ticket.error = error
+            ticket.done.set()
+
+    def close(self, timeout: float = 10.0):
+        """Flush what is queued, then stop the writer. Later submits raise WriteQueueClosed."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._reset()
+            self.closed = True
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return
+            self._q.put(None)
+        thread.join(timeout)
+
+WRITE_QUEUE = WriteBehindQueue(WRITE_BEHIND_QUEUE_SIZE)
+atexit.register(WRITE_QUEUE.close)
+
+# ----------------------------
+# Ingest endpoints
+# ----------------------------
+def _ingest_single(kind: str):
+    """Shared body of the /ingest/<kind> endpoints: (rows, rejected) or an error response."""
+    body = request.get_json(force=True, silent=True) or {}
+    try:
+        rows, rejected = build_ingest_rows(kind, body)
+    except (ValueError, TypeError) as e:
+        return None, (jsonify({"ok": False, "error": str(e)}), 400)
+
+    ticket = None
+    if WRITE_BEHIND and rows:
+        try:
+            ticket = WRITE_QUEUE.submit(kind, rows)
+        except queue.Full:
+            resp = jsonify({"ok": False, "error": "ingest queue full, retry later"})
+            resp.headers["Retry-After"] = "1"
+            return None, (resp, 503)
+        except WriteQueueClosed:
+            pass    # shutting down: write it here instead
+    if ticket is not None:
+        if WRITE_BEHIND_ACK == "commit":
+            if not ticket.wait(WRITE_BEHIND_ACK_TIMEOUT):
+                return None, (jsonify({"ok": False, "error": "timed out waiting for commit"}), 503)
+            if ticket.error is not None:
+                return None, (jsonify({"ok": False, "error": f"write failed: {ticket.error}"}), 500)
+        return (rows, rejected), None
+
+    with get_conn() as conn:
+        apply_ingest(conn, kind, rows)
+    count_ingested(kind, rows)
+    publish_ingest(kind, rows)
+    return (rows, rejected), None
+
+@app.post("/ingest/equity")
+def ingest_equity():
+    _result, error = _ingest_single("equity")
+    return error or jsonify({"ok": True})
+
+@app.post("/ingest/heartbeat")
+def ingest_heartbeat():
+    _result, error = _ingest_single("heartbeat")
+    return error or jsonify({"ok": True})
+
+@app.post("/ingest/pet")
+def ingest_pet():
+    _result, error = _ingest_single("pet")
+    return error or jsonify({"ok": True})
+
+@app.post("/ingest/trade")
+def ingest_trade():
+    _result, error = _ingest_single("trade")
+    return error or jsonify({"ok": True})
+
+@app.post("/ingest/prices")
+def ingest_prices():
+    result, error = _ingest_single("prices")
+    if error:
+        return error
+    rows, rejected = result
+    return jsonify({"ok": True, "count": len(rows), "rejected": rejected})
+
+@app.post("/ingest/event")
+def ingest_event():
+    _result, error = _ingest_single("event")
+    return error or jsonify({"ok": True})
+
+@app.post("/ingest/death")
+def ingest_death():
+    _result, error = _ingest_single("death")
+    return error or jsonify({"ok": True})
+
+def _iter_batch_records(stream, read_size: int = 65536):
+    """
+    Yield (record, error) from a request body holding either newline-delimited
+    JSON or one JSON array, parsing as the bytes arrive so large backfills are
+    never held in memory whole. error is a message for an unparsable record.
+    """
+    head = b""
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        head += chunk
+        if head.strip():
+            break
+    rest = iter(lambda: stream.read(read_size), b"")
+
+    if head.lstrip()[:1] != b"[":
+        buf = b""
+        for chunk in itertools.chain([head], rest):
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_batch_line(line)
+        if buf.strip():
+            yield _parse_batch_line(buf)
+        return
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = text_decoder.decode(head.lstrip()[1:])
+    for chunk in rest:
+        buf += text_decoder.decode(chunk)
+        buf, done = yield from _drain_json_array(decoder, buf)
+        if done:
+            return
+        if len(buf) > 1_000_000:
+            yield None, "malformed JSON array"
+            return
+    buf += text_decoder.decode(b"", final=True)
+    buf, done = yield from _drain_json_array(decoder, buf)
+    if not done:
+        yield None, "malformed JSON array" if buf.strip() else "unterminated JSON array"
+
+def _parse_batch_line(line: bytes):
+    try:
+        return json_loads(line), None
+    except ValueError as e:
+        return None, f"invalid JSON: {e}"
+
+def _drain_json_array(decoder, buf):
+    """Yield complete elements from the front of buf; returns (remaining, saw_closing_bracket)."""
+    pos = 0
+    n = len(buf)
+    while True:
+        while pos < n and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= n:
+            return "", False
+        if buf[pos] == "]":
+            return buf[pos + 1:], True
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            return buf[pos:], False   # incomplete element: wait for more bytes
+        yield obj, None
+        pos = end
+
+def _write_batch_chunk(chunk, results):
+    """Write one chunk of (index, kind, rows) with apply_ingest_group() and record per-record status."""
+    errors = apply_ingest_group([(kind, rows) for _i, kind, rows in chunk])
+    written = set()
+    for (i, kind, _rows), error in zip(chunk, errors):
+        if error is None:
+            written.add(kind)
+        else:
+            results[i] = {"ok": False, "error": f"write failed: {error}"}
+    return written
+
+@app.post("/ingest/batch")
+def ingest_batch():
+    """
+    Mixed records as NDJSON (one object per line) or a JSON array. Each record
+    is the body of the matching /ingest/<kind> endpoint plus "kind": one of
+    equity, heartbeat, pet, trade, prices, event, death. Records are written
+    in transactions of BATCH_CHUNK_SIZE; "results" has one status per record.
+    """
+    results = []
+    chunk = []
+    written = set()
+    for record, error in _iter_batch_records(request.stream):
+        i = len(results)
+        if i >= BATCH_MAX_RECORDS:
+            results.append({"ok": False, "error": f"batch limit of {BATCH_MAX_RECORDS} records reached"})
+            break
+        results.append({"ok": True})
+        if error is None:
+            kind = record.get("kind") if isinstance(record, dict) else None
+            if kind not in INGEST_KINDS:
+                error = f"unknown kind {kind!r}"
+            else:
+                try:
+                    rows, rejected = build_ingest_rows(kind, record)
+                except (ValueError, TypeError) as e:
+                    error = str(e)
+                else:
+                    if rejected:
+                        results[i]["rejected"] = rejected
+                    chunk.append((i, kind, rows))
+        if error is not None:
+            results[i] = {"ok": False, "error": error}
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            written |= _write_batch_chunk(chunk, results)
+            chunk = []
+    if chunk:
+        written |= _write_batch_chunk(chunk, results)
+
+    if written:
+        # One notification instead of thousands: subscribers refetch.
+        BROKER.publish("changed", {"tables": sorted(INGEST_KINDS[k][0] for k in written)})
+
+    accepted = sum(1 for r in results if r["ok"])
+    return jsonify({"ok": True, "accepted": accepted, "failed": len(results) - accepted, "results": results})
 
 # ----------------------------
 # Control endpoints
@@ -639,16 +2990,14 @@ def control_pause():
 
     until = (datetime.now(timezone.utc) + timedelta(seconds=seconds)).replace(microsecond=0).isoformat()
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE control SET state='PAUSED', pause_reason=?, pause_until_utc=?, updated_time_utc=? WHERE id=1",
-        (reason, until, utc_now_iso())
-    )
-    conn.commit()
-    conn.close()
-
-    add_event("warning", "State -> PAUSED", {"pause_until_utc": until, "reason": reason})
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE control SET state='PAUSED', pause_reason=?, pause_until_utc=?, updated_time_utc=? WHERE id=1",
+            (reason, until, utc_now_iso())
+        )
+        touch_tables(conn, ["control"])
+        add_event("warning", "State -> PAUSED", {"pause_until_utc": until, "reason": reason})
+    BROKER.publish("control", {"state": "PAUSED", "pause_until_utc": until, "reason": reason})
     return jsonify({"ok": True, "state": "PAUSED", "pause_until_utc": until, "reason": reason})
 
 @app.post("/control/cryo")
@@ -659,16 +3008,14 @@ def control_cryo():
 
     until = (datetime.now(timezone.utc) + timedelta(seconds=seconds)).replace(microsecond=0).isoformat()
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE control SET state='CRYO', cryo_reason=?, cryo_until_utc=?, updated_time_utc=? WHERE id=1",
-        (reason, until, utc_now_iso())
-    )
-    conn.commit()
-    conn.close()
-
-    add_event("warning", "State -> CRYO", {"cryo_until_utc": until, "reason": reason})
+    with get_conn() as conn:
+        conn.execute(
+            "UPDATE control SET state='CRYO', cryo_reason=?, cryo_until_utc=?, updated_time_utc=? WHERE id=1",
+            (reason, until, utc_now_iso())
+        )
+        touch_tables(conn, ["control"])
+        add_event("warning", "State -> CRYO", {"cryo_until_utc": until, "reason": reason})
+    BROKER.publish("control", {"state": "CRYO", "cryo_until_utc": until, "reason": reason})
     return jsonify({"ok": True, "state": "CRYO", "cryo_until_utc": until, "reason": reason})
 
 @app.post("/control/revive")
@@ -678,6 +3025,7 @@ def control_revive():
 
     _set_control_state("ACTIVE", reason=reason)
     add_event("info", "Revive executed", {"reason": reason})
+    BROKER.publish("control", {"state": "ACTIVE", "reason": reason})
     return jsonify({"ok": True, "state": "ACTIVE"})
 
 # ----------------------------
@@ -686,17 +3034,17 @@ def control_revive():
 def wipe_table(name):
     if name not in ALLOWED_TABLES:
         raise ValueError("Invalid table")
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(f"DELETE FROM {name}")
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        conn.execute(f"DELETE FROM {name}")
+        touch_tables(conn, [name], wiped=True)
 
 @app.delete("/reset/all")
 def reset_all():
-    for t in ["heartbeat","pet","prices","equity","trades","events","deaths"]:
-        wipe_table(t)
-    _set_control_state("ACTIVE", reason="reset/all")
+    with get_conn():
+        for t in ["heartbeat","pet","prices","candles","equity","trades","market_stats","events","deaths"]:
+            wipe_table(t)
+        _set_control_state("ACTIVE", reason="reset/all")
+    BROKER.publish("resync", {"reason": "reset/all"})
     return jsonify({"ok": True})
 
 @app.delete("/reset/events")
@@ -706,7 +3054,9 @@ def reset_events():
 
 @app.delete("/reset/trades")
 def reset_trades():
-    wipe_table("trades")
+    with get_conn():
+        wipe_table("trades")
+        wipe_table("market_stats")
     return jsonify({"ok": True})
 
 @app.delete("/reset/equity")
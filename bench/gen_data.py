@@ -0,0 +1,107 @@
+"""
+Synthetic database for the benchmarks.
+
+    python bench/gen_data.py --rows 1000000 --db /tmp/bench.db
+
+Writes `rows` price ticks spread over MARKETS (one tick per market per
+second, ending now), plus trades and equity at 1% and events at 0.1% of
+that, then rebuilds the candles and market_stats rollups the same way the
+migrations backfill them. Run it in its own process: app reads DB_PATH
+at import.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+MARKETS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "BNBUSDT", "XRPUSDT",
+           "ADAUSDT", "DOGEUSDT", "AVAXUSDT", "LINKUSDT", "DOTUSDT"]
+CHUNK = 100_000
+
+def generate(db_path: str, rows: int, seed: int = 0):
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("RETENTION_ENABLED", "0")
+    os.environ.setdefault("SLOW_QUERY_MS", "0")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import app
+
+    rnd = random.Random(seed)
+    seconds = math.ceil(rows / len(MARKETS))
+    start = int(time.time()) - seconds
+    prices = {m: 10.0 * (i + 1) for i, m in enumerate(MARKETS)}
+
+    def ticks():
+        n = 0
+        for s in range(seconds):
+            t = start + s
+            iso = app._epoch_to_iso(t)
+            for m in MARKETS:
+                if n == rows:
+                    return
+                prices[m] *= 1 + rnd.gauss(0, 0.0005)
+                yield (iso, t, m, prices[m])
+                n += 1
+
+    def trades(n):
+        for i in range(n):
+            t = start + i * seconds // max(1, n)
+            m = rnd.choice(MARKETS)
+            yield (app._epoch_to_iso(t), t, m, rnd.choice(("buy", "sell")), prices[m],
+                   round(rnd.gauss(0, 5), 4), round(rnd.random(), 3), "bench")
+
+    def equity(n):
+        eq = 10_000.0
+        for i in range(n):
+            t = start + i * seconds // max(1, n)
+            eq += rnd.gauss(0, 3)
+            yield (app._epoch_to_iso(t), t, round(eq, 4))
+
+    def events(n):
+        for i in range(n):
+            t = start + i * seconds // max(1, n)
+            yield (app._epoch_to_iso(t), t, "info", "bench event", "{}")
+
+    def insert(sql, it):
+        batch = []
+        for row in it:
+            batch.append(row)
+            if len(batch) == CHUNK:
+                with app.get_conn() as conn:
+                    conn.executemany(sql, batch)
+                batch = []
+        if batch:
+            with app.get_conn() as conn:
+                conn.executemany(sql, batch)
+
+    t0 = time.perf_counter()
+    insert("INSERT INTO prices (time_utc, time_epoch, market, price) VALUES (?, ?, ?, ?)", ticks())
+    insert("INSERT INTO trades (time_utc, time_epoch, market, side, price, pnl_usd, confidence, reason) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", trades(rows // 100))
+    insert("INSERT INTO equity (time_utc, time_epoch, equity_usd) VALUES (?, ?, ?)", equity(rows // 100))
+    insert("INSERT INTO events (time_utc, time_epoch, type, message, details) VALUES (?, ?, ?, ?, ?)",
+           events(rows // 1000))
+    with app.get_conn() as conn:
+        conn.execute("DELETE FROM candles")
+        app._migration_2_candles(conn)
+        conn.execute("DELETE FROM market_stats")
+        app._migration_4_market_stats(conn)
+        app.touch_tables(conn, ["prices", "candles", "trades", "market_stats", "equity", "events"], wiped=True)
+    with app.get_conn() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000, help="price rows")
+    ap.add_argument("--db", required=True)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    if os.path.exists(args.db):
+        sys.exit(f"{args.db} exists; remove it first")
+    took = generate(args.db, args.rows, args.seed)
+    print(f"{args.rows} price rows -> {args.db} in {took:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+JSON codec cost with and without orjson.
+
+    python bench/json_codec.py [--rows 100000] [--details 450] [--repeat 20]
+
+Builds a /data payload from a bench/gen_data.py database and times:
+  encode  json_dumpb(payload, sort_keys=True), as the response provider calls it
+  decode  _safe_json_loads over `details` strings shaped like the events and
+          deaths columns /data decodes on every build
+  build   build_data_payload() end to end
+each with orjson (if installed) and with the stdlib fallback, and checks
+that both decode to the same objects.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from gen_data import MARKETS, generate  # noqa: E402
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000, help="price rows in the generated database")
+    ap.add_argument("--details", type=int, default=450, help="details strings to decode")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    os.environ["SLOW_QUERY_MS"] = "0"
+    generate(os.path.join(tempfile.mkdtemp(), "json.db"), args.rows)
+    import app
+
+    rnd = random.Random(0)
+    details = [json.dumps({
+        "reason": rnd.choice(["stop loss", "drawdown limit", "manual"]),
+        "source": "bot",
+        "markets": rnd.sample(MARKETS, 3),
+        "equity_usd": round(rnd.uniform(9_000, 11_000), 4),
+        "params": {"risk": round(rnd.random(), 3), "window": rnd.randint(10, 500)},
+    }) for _ in range(args.details)]
+
+    state, ctrl = app.is_paused_or_cryo()
+    with app.app.app_context():
+        payload = app.build_data_payload(state, ctrl)
+
+    def best(fn):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return min(times) * 1000
+
+    fast = app.orjson
+    codecs = [("stdlib", None)] + ([("orjson", fast)] if fast is not None else [])
+    results, outputs = {}, {}
+    for name, module in codecs:
+        app.orjson = module
+        outputs[name] = (app.json_dumpb(payload, sort_keys=True), [app._safe_json_loads(d) for d in details])
+        with app.app.app_context():
+            results[name] = (
+                best(lambda: app.json_dumpb(payload, sort_keys=True)),
+                best(lambda: [app._safe_json_loads(d) for d in details]),
+                best(lambda: app.build_data_payload(state, ctrl)),
+            )
+    app.orjson = fast
+    if fast is not None:
+        assert json.loads(outputs["orjson"][0]) == json.loads(outputs["stdlib"][0]), "encoders disagree"
+        assert outputs["orjson"][1] == outputs["stdlib"][1], "decoders disagree"
+
+    print(f"/data payload {len(outputs['stdlib'][0])} bytes, {args.details} details strings, best of {args.repeat}")
+    print(f"  {'':8s} {'encode ms':>10s} {'decode ms':>10s} {'build ms':>10s}")
+    for name, (enc, dec, build) in results.items():
+        print(f"  {name:8s} {enc:10.3f} {dec:10.3f} {build:10.3f}")
+    if fast is None:
+        print("  orjson is not installed: `pip install orjson` to compare")
+
+if __name__ == "__main__":
+    main()
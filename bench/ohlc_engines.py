@@ -0,0 +1,72 @@
+"""
+Compare the OHLC bucketing engines on synthetic ticks.
+
+    python bench/ohlc_engines.py [--ticks 1000000] [--interval 60] [--repeat 5]
+
+Times bucket_ticks() alone (rows already fetched) and the full raw-tick
+/ohlc path through compute_ohlc() with each OHLC_ENGINE (python, numpy,
+sql), against a throwaway database.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ticks", type=int, default=1_000_000)
+    ap.add_argument("--interval", type=int, default=45, help="use a non-rollup interval to hit the raw path")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["RETENTION_ENABLED"] = "0"
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import app
+
+    rnd = random.Random(0)
+    start = 1_700_000_000
+    price = 100.0
+    ticks = []
+    for i in range(args.ticks):
+        price *= 1 + rnd.gauss(0, 0.0005)
+        ticks.append((start + i // 4, price))   # 4 ticks per second
+
+    def best(fn):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return min(times) * 1000
+
+    print(f"{args.ticks} ticks, interval {args.interval}s, best of {args.repeat}")
+    engines = ["python", "sql"] if app.np is None else ["python", "numpy", "sql"]
+    results = {}
+    for engine in engines[:-1]:
+        results[engine] = app.bucket_ticks(ticks, args.interval, engine)
+        print(f"  bucket_ticks  {engine:6s} {best(lambda: app.bucket_ticks(ticks, args.interval, engine)):9.1f} ms")
+    assert all(r == results["python"] for r in results.values()), "engines disagree"
+
+    with app.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO prices (time_utc, time_epoch, market, price) VALUES ('', ?, 'BENCH', ?)", ticks
+        )
+    limit = 1000
+    # Wide enough that every tick falls inside the requested window.
+    interval = max(args.interval, -(-args.ticks // 4 // limit))
+    if interval in app.ROLLUP_INTERVALS:
+        interval += 1
+    candles = {}
+    for engine in engines:
+        app.OHLC_ENGINE = engine
+        candles[engine] = app.compute_ohlc("BENCH", interval, limit, from_epoch=start)
+        ms = best(lambda: app.compute_ohlc("BENCH", interval, limit, from_epoch=start))
+        print(f"  compute_ohlc  {engine:6s} {ms:9.1f} ms  (interval {interval}s, {limit} candles)")
+    assert all(c == candles["python"] for c in candles.values()), "engines disagree"
+
+if __name__ == "__main__":
+    main()
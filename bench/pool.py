@@ -0,0 +1,87 @@
+"""
+Per-call connection overhead: a new sqlite3 connection per `with get_conn()`
+block (what the app did before the pool) against the pool.
+
+    python bench/pool.py [--rows 10000] [--calls 2000] [--repeat 5]
+
+Times fetch_one("heartbeat"), an uncached GET /data and POST /ingest/trade
+through the Flask test client against a database from bench/gen_data.py.
+"connect" swaps get_conn() for one that opens a connection (with the app's
+pragmas), commits or rolls back, and closes it, so nested blocks each open
+their own as they used to.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from gen_data import MARKETS, generate  # noqa: E402
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000, help="price rows in the generated database")
+    ap.add_argument("--calls", type=int, default=2000, help="calls per timing")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    os.environ["SLOW_QUERY_MS"] = "0"
+    generate(os.path.join(tempfile.mkdtemp(), "pool.db"), args.rows)
+    import app
+
+    pooled = app.get_conn
+
+    @contextmanager
+    def connect_per_call():
+        conn = sqlite3.connect(app.DB_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        app._apply_connection_pragmas(conn)
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    client = app.app.test_client()
+    trade = {"market": MARKETS[0], "side": "buy", "size_usd": 50, "price": 100.0, "pnl_usd": 1, "confidence": 0.5}
+
+    def get_data():
+        app.DATA_CACHE.clear()
+        client.get("/data").get_data()
+
+    scenarios = [
+        ("fetch_one(heartbeat)", lambda: app.fetch_one("heartbeat"), args.calls),
+        ("GET /data (uncached)", get_data, max(1, args.calls // 10)),
+        ("POST /ingest/trade", lambda: client.post("/ingest/trade", json=trade), max(1, args.calls // 10)),
+    ]
+
+    def best(fn, n):
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            times.append((time.perf_counter() - t0) / n)
+        return min(times) * 1e6
+
+    print(f"{args.rows} price rows, best of {args.repeat}, microseconds per call")
+    print(f"  {'':22s} {'connect':>10s} {'pool':>10s}")
+    for name, fn, n in scenarios:
+        us = {}
+        for mode, get_conn in (("connect", connect_per_call), ("pool", pooled)):
+            app.get_conn = get_conn
+            fn()
+            us[mode] = best(fn, n)
+        print(f"  {name:22s} {us['connect']:10.1f} {us['pool']:10.1f}")
+    app.get_conn = pooled
+
+if __name__ == "__main__":
+    main()
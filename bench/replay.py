@@ -0,0 +1,160 @@
+"""
+Replay traffic recorded with RECORD_TRAFFIC=/path/traffic.jsonl.
+
+    python bench/replay.py traffic.jsonl --target http://127.0.0.1:8000 --speed 10
+    python bench/replay.py traffic.jsonl --db /tmp/replay.db --speed 0
+
+--speed 1 keeps the recorded spacing between requests, 10 compresses it
+tenfold, and 0 sends them back to back. Against --target, requests are
+sent on schedule from a thread pool (open loop), so a slow server builds
+a backlog the same way it would in production. Without --target they go
+through the Flask test client in this process, one at a time, against
+--db (default: a fresh scratch database).
+
+Recorded conditional and Accept-Encoding headers are sent again, so polls
+that got a 304 or a compressed body are replayed as such. Reports latency
+percentiles and errors per route, plus how many responses came back with
+a different status than the one recorded. Requests whose
+body was not recorded (body_skipped) are counted and not sent.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from run import _summary  # noqa: E402
+
+def load(path):
+    with open(path, "rb") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda e: e["ts"])
+    return entries
+
+def _route(path: str) -> str:
+    return path.split("?", 1)[0]
+
+def http_sender(target: str, concurrency: int):
+    u = urlsplit(target)
+    local = threading.local()
+
+    def send(e):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=60)
+        body = e["body"].encode() if e.get("body") is not None else None
+        headers = dict(e.get("headers") or {})
+        if e.get("content_type"):
+            headers["Content-Type"] = e["content_type"]
+        t0 = time.perf_counter()
+        try:
+            conn.request(e["method"], (u.path.rstrip("/") or "") + e["path"], body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (OSError, http.client.HTTPException):
+            local.conn = None
+            status = 599
+        return time.perf_counter() - t0, status
+
+    return send, ThreadPoolExecutor(max_workers=concurrency)
+
+def test_client_sender(db_path: str):
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("RETENTION_ENABLED", "0")
+    os.environ.pop("RECORD_TRAFFIC", None)
+    sys.path.insert(0, os.path.dirname(HERE))
+    import app
+    client = app.app.test_client()
+
+    def send(e):
+        t0 = time.perf_counter()
+        resp = client.open(e["path"], method=e["method"], data=e.get("body"),
+                           content_type=e.get("content_type") or None, headers=e.get("headers") or {})
+        resp.get_data()
+        return time.perf_counter() - t0, resp.status_code
+
+    return send, None
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("traffic", help="JSONL written by RECORD_TRAFFIC")
+    ap.add_argument("--speed", type=float, default=1.0, help="time compression; 0 = as fast as possible")
+    ap.add_argument("--target", help="base URL of a running server; default is the in-process test client")
+    ap.add_argument("--db", help="database for the in-process test client (default: scratch file)")
+    ap.add_argument("--concurrency", type=int, default=16, help="client threads against --target")
+    ap.add_argument("--out", help="write the report as JSON")
+    args = ap.parse_args()
+
+    entries = load(args.traffic)
+    skipped = [e for e in entries if e.get("body_skipped")]
+    entries = [e for e in entries if not e.get("body_skipped")]
+    if not entries:
+        sys.exit("nothing to replay")
+
+    if args.target:
+        send, pool = http_sender(args.target, args.concurrency)
+    else:
+        send, pool = test_client_sender(args.db or os.path.join(tempfile.mkdtemp(), "replay.db"))
+
+    first = entries[0]["ts"]
+    started = time.perf_counter()
+
+    def scheduled(e):
+        if args.speed > 0:
+            delay = (e["ts"] - first) / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        return send(e)
+
+    if pool is None:
+        results = [scheduled(e) for e in entries]
+    else:
+        with pool:
+            results = list(pool.map(scheduled, entries))
+    elapsed = time.perf_counter() - started
+
+    by_route = defaultdict(lambda: ([], [0], [0]))
+    for e, (secs, status) in zip(entries, results):
+        lat, errors, changed = by_route[f"{e['method']} {_route(e['path'])}"]
+        lat.append(secs)
+        errors[0] += status >= 400
+        changed[0] += status != e.get("status", status)
+
+    report = {
+        "traffic": args.traffic,
+        "target": args.target or "test_client",
+        "speed": args.speed,
+        "sent": len(entries),
+        "skipped": len(skipped),
+        "seconds": round(elapsed, 3),
+        "recorded_seconds": round(entries[-1]["ts"] - first, 3),
+        "routes": [],
+    }
+    all_lat = []
+    print(f"{len(entries)} requests in {elapsed:.1f}s (recorded over {report['recorded_seconds']:.1f}s), "
+          f"{len(skipped)} skipped")
+    print(f"  {'route':32s} {'n':>6s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'errors':>6s} {'status!=':>8s}")
+    for route in sorted(by_route):
+        lat, errors, changed = by_route[route]
+        all_lat += lat
+        r = _summary(route, lat, errors[0], elapsed)
+        r["status_changed"] = changed[0]
+        report["routes"].append(r)
+        print(f"  {route:32s} {r['requests']:6d} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} {r['p99_ms']:9.3f} "
+              f"{r['max_ms']:9.3f} {r['errors']:6d} {r['status_changed']:8d}")
+    report["total"] = _summary("total", all_lat, sum(r["errors"] for r in report["routes"]), elapsed)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Throughput and latency benchmarks for the ingest and read paths.
+
+    python bench/run.py                                  # 10k rows, Flask test client
+    python bench/run.py --sizes 10k,1m,10m --out before.json
+    python bench/run.py --sizes 1m --gunicorn --workers 2 --concurrency 8
+    python bench/run.py --sizes 1m --out after.json --compare before.json
+
+For each size a synthetic database is generated once (bench/gen_data.py)
+under --data-dir and copied to a scratch file for every run, so runs start
+from the same data. Read scenarios run before the ingest scenarios.
+
+Modes:
+  default     in-process Flask test client, one request at a time: app cost
+              without HTTP or worker effects.
+  --gunicorn  starts `gunicorn app:app` on a free local port and drives it
+              over HTTP with --concurrency client threads.
+
+Results (per size and scenario: requests, errors, rps, p50/p95/p99/max in
+ms) are printed and, with --out, written as JSON together with the git
+revision and Python/SQLite versions. --compare prints the change against
+an earlier result file.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+from gen_data import MARKETS  # noqa: E402
+
+def _size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s.rstrip("km")) * mult)
+
+def _label(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}m"
+    if n >= 1_000 and n % 1_000 == 0:
+        return f"{n // 1_000}k"
+    return str(n)
+
+# (name, method, path, body factory or None, in-process hook run before each request or None)
+def scenarios(gunicorn: bool):
+    def prices_body(i):
+        return {"prices": {m: 100.0 + (i % 97) * 0.01 for m in MARKETS}}
+
+    def trade_body(i):
+        return {"market": MARKETS[i % len(MARKETS)], "side": "buy" if i % 2 else "sell",
+                "size_usd": 50, "price": 100.0, "pnl_usd": (i % 7) - 3, "confidence": 0.5}
+
+    def clear_data_cache():
+        import app
+        app.DATA_CACHE.clear()
+
+    out = [
+        ("data", "GET", "/data", None, None),
+        ("ohlc_rollup", "GET", f"/ohlc?market={MARKETS[0]}&interval=60&limit=200", None, None),
+        ("ohlc_raw", "GET", f"/ohlc?market={MARKETS[0]}&interval=45&limit=200", None, None),
+        ("ohlc_multi", "GET", f"/ohlc?markets={','.join(MARKETS[:5])}&interval=300&limit=200", None, None),
+        ("ingest_prices", "POST", "/ingest/prices", prices_body, None),
+        ("ingest_trade", "POST", "/ingest/trade", trade_body, None),
+    ]
+    if not gunicorn:
+        # Cache misses can only be forced in-process.
+        out.insert(1, ("data_uncached", "GET", "/data", None, clear_data_cache))
+    return out
+
+def _summary(name, latencies, errors, elapsed):
+    lat = sorted(latencies)
+
+    def pct(p):
+        if not lat:
+            return None
+        return round(lat[min(len(lat) - 1, max(0, int(round(p / 100 * len(lat))) - 1))] * 1000, 3)
+
+    return {
+        "scenario": name,
+        "requests": len(lat),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(lat) / elapsed, 1) if elapsed else None,
+        "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "max_ms": round(lat[-1] * 1000, 3) if lat else None,
+    }
+
+def run_test_client(db_path: str, requests: int, warmup: int):
+    """Runs in a child process: app binds DB_PATH at import."""
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("RETENTION_ENABLED", "0")
+    sys.path.insert(0, ROOT)
+    import app
+
+    client = app.app.test_client()
+    results = []
+    for name, method, path, body, before in scenarios(gunicorn=False):
+        for i in range(warmup):
+            client.open(path, method=method, json=body(i) if body else None)
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for i in range(requests):
+            payload = body(i) if body else None
+            if before:
+                before()
+            t0 = time.perf_counter()
+            resp = client.open(path, method=method, json=payload)
+            resp.get_data()
+            latencies.append(time.perf_counter() - t0)
+            errors += resp.status_code >= 400
+        results.append(_summary(name, latencies, errors, time.perf_counter() - started))
+    return results
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def run_gunicorn(db_path: str, requests: int, warmup: int, workers: int, concurrency: int):
+    port = _free_port()
+    env = dict(os.environ, DB_PATH=db_path, RETENTION_ENABLED=os.getenv("RETENTION_ENABLED", "0"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                c = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+                c.request("GET", "/heartbeat")
+                c.getresponse().read()
+                break
+            except OSError:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+
+        local = threading.local()
+
+        def one(method, path, payload):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            body = json.dumps(payload) if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body else {}
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+            except (OSError, http.client.HTTPException):
+                local.conn = None
+                status = 599
+            return time.perf_counter() - t0, status
+
+        results = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for name, method, path, body, _before in scenarios(gunicorn=True):
+                list(pool.map(lambda i: one(method, path, body(i) if body else None), range(warmup)))
+                started = time.perf_counter()
+                out = list(pool.map(lambda i: one(method, path, body(i) if body else None), range(requests)))
+                elapsed = time.perf_counter() - started
+                results.append(_summary(name, [t for t, _ in out], sum(s >= 400 for _, s in out), elapsed))
+        return results
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def _compare(results, old_path):
+    with open(old_path) as f:
+        old = {(r["size"], r["mode"], r["scenario"]): r for r in json.load(f)["results"]}
+    print(f"\nchange vs {old_path} (negative latency / positive rps is better)")
+    for r in results:
+        o = old.get((r["size"], r["mode"], r["scenario"]))
+        if not o:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            if o.get(key) and r.get(key) is not None:
+                parts.append(f"{key} {100 * (r[key] - o[key]) / o[key]:+6.1f}%")
+        print(f"  {r['size']:>5} {r['scenario']:15s} " + "  ".join(parts))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    ap.add_argument("--sizes", default="10k", help="price rows per DB, e.g. 10k,1m,10m")
+    ap.add_argument("--requests", type=int, default=500, help="timed requests per scenario")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--gunicorn", action="store_true")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--data-dir", default=os.path.join(os.getenv("TMPDIR", "/tmp"), "tradebot-bench"))
+    ap.add_argument("--regen", action="store_true", help="rebuild the generated databases")
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--compare", help="earlier --out file to diff against")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        json.dump(run_test_client(args.child, args.requests, args.warmup), sys.stdout)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    mode = "gunicorn" if args.gunicorn else "test_client"
+    results = []
+    for n in [_size(s) for s in args.sizes.split(",") if s.strip()]:
+        template = os.path.join(args.data_dir, f"prices-{_label(n)}.db")
+        if args.regen or not os.path.exists(template):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(template + suffix):
+                    os.remove(template + suffix)
+            subprocess.run([sys.executable, os.path.join(HERE, "gen_data.py"), "--rows", str(n), "--db", template],
+                           check=True)
+        work = os.path.join(args.data_dir, f"run-{_label(n)}.db")
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(work + suffix):
+                os.remove(work + suffix)
+        shutil.copyfile(template, work)
+
+        if args.gunicorn:
+            rows = run_gunicorn(work, args.requests, args.warmup, args.workers, args.concurrency)
+        else:
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", work,
+                 "--requests", str(args.requests), "--warmup", str(args.warmup)],
+                check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+            rows = json.loads(out)
+
+        print(f"\n{_label(n)} price rows, {mode}" + (f", {args.workers} workers x {args.concurrency} clients" if args.gunicorn else ""))
+        print(f"  {'scenario':15s} {'rps':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'errors':>6s}")
+        for r in rows:
+            r.update(size=_label(n), rows=n, mode=mode)
+            print(f"  {r['scenario']:15s} {r['rps']:9.1f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} "
+                  f"{r['p99_ms']:9.3f} {r['max_ms']:9.3f} {r['errors']:6d}")
+            results.append(r)
+
+    doc = {
+        "meta": {
+            "git_rev": _git_rev(),
+            "time_utc": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("child", "out", "compare")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
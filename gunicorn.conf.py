@@ -0,0 +1,12 @@
+# Picked up automatically by `gunicorn app:app` when started from this directory.
+import os
+
+# /stream holds a connection open per dashboard tab; with threads > 1 gunicorn
+# runs gthread workers so streams don't take every worker.
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+def worker_exit(server, worker):
+    # Flush queued ingest writes, then close pooled SQLite connections.
+    import app
+    app.WRITE_QUEUE.close()
+    app.POOL.close()
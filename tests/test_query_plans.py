@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# app opens DB_PATH at import: point it at a scratch database first.
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "plans.db")
+os.environ["RETENTION_ENABLED"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+def test_hot_queries_use_their_indexes():
+    app.init_db()
+    with app.get_conn() as conn:
+        results = app.check_query_plans(conn)
+    assert len(results) == len(app.HOT_QUERIES)
+    bad = {r["query"]: r["plan"] for r in results if not r["ok"]}
+    assert not bad, bad